@@ -1,55 +1,209 @@
 #!/usr/bin/env seiscomp-python
 # -*- coding: utf-8 -*-
 
+import os
 import sys
+import glob
+import time
+import tempfile
 import traceback
+import threading
+import collections
+import multiprocessing
+from bisect import bisect_left
 from seiscomp import client, datamodel
 from seiscomp.client import Protocol
-from seiscomp.math import delazi_wgs84
 from seiscomp.core import Time
 from numpy import average
 from seiscomp import io
 from seiscomp.logging import info, debug, warning, error
+from scdummyloc_engine import PickRecord, Cluster, StationIndex, StageTimes, Associator, time2float, timed
+
+
+
+class OriginWriter(object):
+    """
+    Appends origins to an XML output as they are released.
+
+    Each origin is serialised on its own by XMLArchive and its element is
+    appended within the EventParameters of the output, which is flushed
+    so that an interrupted replay leaves all released origins on disk.
+    Origins are not kept in memory. close() completes the document.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.output = None
+        self.footer = None
+        self.count = 0
+        # scratch file XMLArchive writes each origin to, kept open for reading
+        self.scratch = tempfile.NamedTemporaryFile(mode='r', suffix='.xml')
+
+    def serialise(self, origin):
+        ep = datamodel.EventParameters()
+        ep.add(origin)
+        ar = io.XMLArchive()
+        if not ar.create(self.scratch.name):
+            ep.remove(origin)
+            raise IOError('unable to create %s' % self.scratch.name)
+        ar.setFormattedOutput(True)
+        ar.writeObject(ep)
+        ar.close()
+        ep.remove(origin)
+        self.scratch.seek(0)
+        text = self.scratch.read()
+
+        # XMLArchive writes the XML declaration and the <seiscomp> root,
+        # then <EventParameters ...> with or without attributes, the origin
+        # element and the closing tags, each on its own line. The part up
+        # to the EventParameters start tag is the header of the output, the
+        # part from its end tag on the footer.
+        tag = text.find('<EventParameters')
+        start = text.find('>', tag) + 1
+        end = text.rfind('</EventParameters>')
+        if tag < 0 or start <= 0 or end < start:
+            raise ValueError('unexpected XMLArchive output, no EventParameters element around origin %s' %
+                             origin.publicID())
+        end = len(text[:end].rstrip(' \t'))
+        return text[:start] + '\n', text[start:end].lstrip('\n'), text[end:]
+
+    def write(self, origin):
+        header, element, footer = self.serialise(origin)
+        if self.output is None:
+            self.output = open(self.path, 'w')
+            self.output.write(header)
+            self.footer = footer
+        self.output.write(element)
+        self.output.flush()
+        self.count += 1
+
+    def close(self):
+        self.scratch.close()
+        if self.output is None:
+            # no origin, write an empty document
+            ar = io.XMLArchive()
+            ar.create(self.path)
+            ar.setFormattedOutput(True)
+            ar.writeObject(datamodel.EventParameters())
+            ar.close()
+            return
 
-class Cluster(object):
-    
-    def __init__(self, *picks):
-        self.picks = [p for p in picks]
+        self.output.write(self.footer)
+        self.output.close()
+        self.output = None
+        info('Wrote %d origins to %s' % ( self.count, self.path ))
+
+
+class SendQueue(object):
+    """
+    Bounded queue of messages sent by a background thread.
+
+    Each message is queued as its parts, (cluster key, origin part) pairs,
+    which send() assembles. put() returns as soon as the message is queued.
+    When the queue is full, the 'block' policy waits for the sender,
+    'coalesce' replaces the origin of each cluster already queued, also
+    within a batch of other clusters, by its latest one and queues the
+    remaining parts (blocking if still full), 'drop' discards the oldest
+    queued message. Depth and latency from queueing to sending are logged
+    every report_interval seconds.
+    """
+
+    policies = ( 'block', 'coalesce', 'drop' )
+
+    def __init__(self, send, size=100, policy='block', report_interval=60.):
+        if policy not in self.policies:
+            raise ValueError("unknown send queue policy '%s'" % policy)
+        self.send = send
+        self.size = max(1, size)
+        self.policy = policy
+        self.report_interval = report_interval
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.max_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.latency_sum = 0.
+        self.latency_max = 0.
+        self.reported = time.time()
+        self.thread = threading.Thread(target=self.work, name='SendQueue', daemon=True)
+        self.thread.start()
+
+    def depth(self):
+        return len(self.items)
+
+    def put(self, parts):
+        with self.condition:
+            if self.policy == 'coalesce' and len(self.items) >= self.size:
+                parts = [ (key, part) for key, part in parts if not self.replace(key, part) ]
+                if not parts:
+                    return True
+
+            while len(self.items) >= self.size and not self.closed:
+                if self.policy == 'drop':
+                    self.items.popleft()
+                    self.dropped += 1
+                    warning('Send queue full, oldest message dropped')
+                    break
+                self.condition.wait()
+
+            self.items.append([ parts, time.time() ])
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify_all()
+        return True
+
+    def replace(self, key, part):
+        # latest origin of the cluster in its last queued message, sent
+        # after the earlier ones
+        if key is None:
+            return False
+        for parts, queued in reversed(self.items):
+            for i, (queued_key, queued_part) in enumerate(parts):
+                if queued_key == key:
+                    parts[i] = (key, part)
+                    self.coalesced += 1
+                    return True
+        return False
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.items and not self.closed:
+                    self.condition.wait(self.report_interval)
+                    self.report()
+                if not self.items:
+                    return
+                parts, queued = self.items.popleft()
+                self.condition.notify_all()
+
+            try:
+                self.send(parts)
+            except Exception:
+                traceback.print_exc()
+
+            latency = time.time() - queued
+            self.sent += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.report()
+
+    def report(self, force=False):
+        if not force and time.time() - self.reported < self.report_interval:
+            return
+        self.reported = time.time()
+        info('Send queue: depth %d (max %d), %d sent, %d coalesced, %d dropped, latency mean %.3f s max %.3f s' % (
+            self.depth(), self.max_depth, self.sent, self.coalesced, self.dropped,
+            self.latency_sum / max(self.sent, 1), self.latency_max ))
+
+    def close(self):
+        # sends the queued messages and stops the thread
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.report(True)
 
-    def tmin( self ):
-        return min([ pick.time().value() for pick in self.picks ])
-    
-    def time_min( self ):
-        return [ pick.time().value() for pick in self.picks if pick.time().value() == self.tmin()][0]
-    
-    def tmax( self ):
-        return max([ pick.time().value() for pick in self.picks ])
-    
-    def len( self ):
-        return len( self.picks )
-    
-    def get_coordinates(self):            
-        return [ [ pick.la, pick.lo, pick.el ] for pick in self.picks ] 
-
-    def get_weights(self):
-        # weight should not reach 0
-        tmax = self.tmax()
-        tnorm = float(self.tmax()-self.tmin())
-        return [ float(tmax - pick.time().value())/tnorm+0.01 for pick in self.picks ] 
-    
-    def get_ids(self):
-
-        mseedids = []
-        for pick in self.picks:
-            wfid = pick.waveformID()
-            mseedid = '%s.%s' % ( str(wfid.networkCode()),
-                                  str(wfid.stationCode()) )            
-            mseedid += '.'+str(wfid.locationCode())
-            mseedid += '.'+str(wfid.channelCode())
-            mseedids += [mseedid]
-
-        return mseedids
-    
 
 class PickListener(client.Application):
 
@@ -61,8 +215,10 @@ class PickListener(client.Application):
         self.setPrimaryMessagingGroup("LOCATION")
         self.addMessagingSubscription("PICK")
         self.setLoadStationsEnabled(True)
-        self.pick_buffer = []
-        self.clusters = []
+        self.stage_times = StageTimes()
+        self.associator = Associator(release=self.cluster_release,
+                                     drop=self.cluster_dropped,
+                                     stage_times=self.stage_times)
 
         # Config
         self.max_buffer_interval = 3*60*60. # A buffer of 3 hours in seconds
@@ -81,11 +237,34 @@ class PickListener(client.Application):
         self.enable_loc_clust = True      # Useful if sta code is the same for distant instrument with different location code
         self.enable_cha_clust = False     # Useful if chanel level has coordinates (not in SED) and loc code is the same for distant instrument 
         self.enable_same_id_clust = False # Useful if the same stream should contribute several time to origin       
+        self.enable_clust_merge = True    # if True clusters bridged by a pick pair are merged into one
+        self.incremental_association = True # if True only pairs with the new pick are evaluated, else the whole buffer is scanned
+        self.release_first_delay = 0.     # in seconds, maximal delay of the first release of a cluster
+        self.release_hold_off = 0.        # in seconds, minimal time between releases of a cluster, updates in between are coalesced
+        self.batch_origins = True         # if True origins released together are sent in one message
+        self.batch_interval = 0.          # in seconds, origins released within are sent in one message
+        self.send_queue_size = 100        # messages waiting for the background sender, 0 sends synchronously
+        self.send_queue_policy = 'block'  # if the send queue is full: block, coalesce (per cluster) or drop (oldest)
+        self.update_origins = False       # if True each cluster keeps one origin, updated on growth
+        self.stage_report_interval = 600. # in seconds, between logs of the pipeline stage times, 0 never logs
 
         self.inputFile = None
         self.inputFormat = 'xml'
         self.outputFile = '/dev/stdout'
         self.playback = False
+        self.jobs = 1
+        self.batchFiles = []
+        self.batchFormats = {}
+        self.outputDir = None
+        self.send_batch = None
+        self.send_batch_start = 0.
+        self.sent_messages = 0
+        self.sent_origins = 0
+        self.calls_saved = 0
+        self.send_queue = None
+        self.cluster_origins = {}
+        self.origin_changes = {}
+        self.stage_reported = time.time()
 
 
     def validateParameters(self):
@@ -123,11 +302,58 @@ class PickListener(client.Application):
             except RuntimeError:
                 pass
 
+            try:
+                self.jobs = max(1, self.commandline().optionInt("jobs"))
+            except RuntimeError:
+                pass
+
+            try:
+                self.batchFiles = self.batch_files(self.commandline().optionString("batch"))
+                self.test = True
+                self.setMessagingEnabled(False)
+                self.setLoggingToStdErr(True)
+                if self.commandline().hasOption("output"):
+                    self.outputDir = self.outputFile
+                if not self.batchFiles:
+                    error("no input file found for --batch")
+                    return False
+                self.batchFormats = dict([ (f, self.batch_format(f)) for f in self.batchFiles ])
+                outputs = {}
+                for inputFile in self.batchFiles:
+                    output = self.batch_output(inputFile)
+                    if output in outputs:
+                        error("%s and %s would both be written to %s" % ( outputs[output], inputFile, output ))
+                        return False
+                    outputs[output] = inputFile
+            except RuntimeError:
+                pass
+
             return True
         except Exception:
             traceback.print_exc()
             sys.exit(-1)
 
+    def batch_files(self, patterns):
+        # comma separated glob patterns or directories, in sorted order,
+        # without outputs of previous batches
+        files = []
+        for pattern in patterns.split(','):
+            if os.path.isdir(pattern):
+                pattern = os.path.join(pattern, '*')
+            files += sorted([ f for f in glob.glob(pattern)
+                              if os.path.isfile(f) and not f.endswith('.origins.xml') ])
+        return files
+
+    def batch_format(self, inputFile):
+        # input format of a batch file by its extension, else --format
+        name = inputFile.lower()
+        for extensions, inputFormat in ( ( ('.xml',), 'xml' ),
+                                          ( ('.zxml', '.xml.gz', '.xml.zip'), 'zxml' ),
+                                          ( ('.bin', '.vbin'), 'binary' ) ):
+            if name.endswith(extensions):
+                return inputFormat
+        return self.inputFormat
+
     def createCommandLineDescription(self):
         self.commandline().addGroup("Input")
         self.commandline().addStringOption(
@@ -137,11 +363,22 @@ class PickListener(client.Application):
         self.commandline().addStringOption(
             "Input", "format,f",
             "input format to use (xml [default], zxml (zipped xml), binary). "
-            "Only relevant with --ep.")
+            "Only relevant with --ep, and with --batch for files without a "
+            ".xml, .zxml, .xml.gz, .xml.zip, .bin or .vbin extension.")
         self.commandline().addStringOption(
             "Input", "output,o",
             "write origins to specific XML file instead of stdout. "
             "Only relevant with --input.")
+        self.commandline().addStringOption(
+            "Input", "batch",
+            "read picks from each of the files matching comma separated glob "
+            "patterns or directories, one output per input file named "
+            "<input>.origins.xml next to the input or in the --output "
+            "directory. The format of each file follows from its extension.")
+        self.commandline().addIntOption(
+            "Input", "jobs,j",
+            "number of worker processes associating time windows of the "
+            "picks in parallel with --ep, or files in parallel with --batch.")
         self.commandline().addOption(
             "Input", "playback",
             "Release origins in real-time, similar to online processing, else "
@@ -174,6 +411,10 @@ class PickListener(client.Application):
             self.max_pick_distance = self.configGetDouble("max_pick_distance")
         except Exception as e:
             pass
+        try:
+            self.min_pick_distance = self.configGetDouble("min_pick_distance")
+        except Exception as e:
+            pass
         try:
             self.default_phase_type = self.configGetString("default_phase_type")
             info('default_phase_type: %s' % self.default_phase_type )
@@ -214,25 +455,121 @@ class PickListener(client.Application):
             self.enable_same_id_clust = self.configGetBool("enable_same_id_clust")
         except Exception as e:
             pass
+        try:
+            self.enable_clust_merge = self.configGetBool("enable_clust_merge")
+        except Exception as e:
+            pass
+        try:
+            self.incremental_association = self.configGetBool("incremental_association")
+        except Exception as e:
+            pass
+        try:
+            self.release_first_delay = self.configGetDouble("release_first_delay")
+        except Exception as e:
+            pass
+        try:
+            self.release_hold_off = self.configGetDouble("release_hold_off")
+        except Exception as e:
+            pass
+        try:
+            self.batch_origins = self.configGetBool("batch_origins")
+        except Exception as e:
+            pass
+        try:
+            self.batch_interval = self.configGetDouble("batch_interval")
+        except Exception as e:
+            pass
+        try:
+            self.send_queue_size = self.configGetInt("send_queue_size")
+        except Exception as e:
+            pass
+        try:
+            self.send_queue_policy = self.configGetString("send_queue_policy")
+        except Exception as e:
+            pass
+        try:
+            self.update_origins = self.configGetBool("update_origins")
+        except Exception as e:
+            pass
+        try:
+            self.stage_report_interval = self.configGetDouble("stage_report_interval")
+        except Exception as e:
+            pass
         
 
         return True
 
+    def init(self):
+
+        if not client.Application.init(self):
+            return False
+
+        self.associator_configure()
+        self.station_index_build()
+
+        if ( self.associator.release_debounced() or self.batch_interval > 0. ) and self.inputFile is None and not self.batchFiles:
+            # releases are due and batches flushed on the timer, not on pick arrival
+            self.enableTimer(1)
+
+        if self.send_queue_size > 0 and not self.test and self.inputFile is None and not self.batchFiles:
+            if self.update_origins and self.send_queue_policy == 'drop':
+                # a dropped message would lose changes which are sent once
+                error('send_queue_policy drop cannot be used with update_origins')
+                return False
+            try:
+                self.send_queue = SendQueue(self.parts_send,
+                                            self.send_queue_size,
+                                            self.send_queue_policy)
+            except ValueError as e:
+                error(str(e))
+                return False
+
+        return True
+
+    def done(self):
+        # origins still waiting for their batch
+        self.send_flush(True)
+        if self.send_queue is not None:
+            self.send_queue.close()
+        client.Application.done(self)
+
+    def handleTimeout(self):
+        try:
+            self.send_begin()
+            self.associator.release_due( self.release_clock() )
+            self.send_flush()
+        except Exception:
+            traceback.print_exc()
+
     def handlePick(self, pick):
+        self.handleRecord( self.pick_record(pick) )
+
+    def handleRecord(self, record):
         try:
-            self.buffer_add( pick )
+            if self.associator.station_index is None:
+                self.station_index_build()
 
-            self.buffer_scan( )
+            self.associator.add( record )
 
             if self.playback or self.inputFile is None:
                 self.origins_release()
             else:
                 info('Skipping real-time origin release because options playback=%s or ep=%s' % ( self.playback, self.inputFile ))
+                self.origins_expired()
+
+            if ( self.stage_report_interval > 0. and
+                 time.time() - self.stage_reported >= self.stage_report_interval ):
+                self.stage_report()
             
         except Exception:
             traceback.print_exc()
             return
 
+    def stage_report(self):
+        self.stage_reported = time.time()
+        for line in self.stage_times.summary():
+            info('Stage %s' % line)
+
     def updateObject(self, parentID, scobject):
         # called if an updated object is received
         pick = datamodel.Pick.Cast(scobject)
@@ -247,295 +584,120 @@ class PickListener(client.Application):
             debug("received new pick {}".format(pick.publicID()))
             self.handlePick(pick)
     
-    def buffer_add(self, pick):
-
-        if ( sta := self.pick2chan( pick ) ) is False :
-            wfid = pick.waveformID()
-            error('STATION %s.%s NOT IN INVENTORY' % ( str(wfid.networkCode()),
-                                                         str(wfid.stationCode())))
-            return
-        
-        pick.la = sta['la']
-        pick.lo = sta['lo']
-        pick.el = sta['el']
-        self.pick_buffer += [ pick ]
-        
-        debug('Buffer beginning: %s ending: %s lasting: %d s' % ( self.buffer_min(), self.buffer_max(), self.buffer_len() ))
-
-        if float( self.buffer_max() - self.buffer_min() )  > self.max_buffer_interval :
-            to_pop = []
-            for pick in self.pick_buffer:
-                if float( self.buffer_max() - pick.time().value() )  > self.max_buffer_interval:
-                    to_pop += [ pick ]
-
-            for pick in to_pop:
-                debug("removed: {}".format(pick.publicID()))
-                self.pick_buffer.remove(pick)
-        
-        debug('in buffer for {}:'.format(pick.time().value(),))
-        debug('Buffer beginning: %s ending: %s lasting: %d s' % ( self.buffer_min(), self.buffer_max(), self.buffer_len() ))
-        
-        to_pop = []
-        for c in self.clusters:
-            if float( self.buffer_max() - c.tmax() ) > self.max_buffer_interval :
-                # OUTDATED CLUSTER (endtime<buffer starttime)
-                to_pop += [c]
-        for c in to_pop:
-            debug("removed: cluster ending on {}".format(c.tmax()))
-            self.clusters.remove(c)
-    
-    def is_staloccha_availableattime(self, staloccha, pick):
-
-        try:
-            start = staloccha.start()
-        except Exception:
-            return False 
-        try:
-            end = staloccha.end()
-            if not start <= pick.time().value() <= end:
-                return False 
-        except Exception:
-            return True   
-
-        return True 
-        
-    def pick2chan(self, pick):
+    def pick_record(self, pick):
+        # the only reads of the pick before origins are made
         wfid = pick.waveformID()
-
-        debug('%s.%s.%s.%s at %s' % ( str(wfid.networkCode()),
-                                      str(wfid.stationCode()),
-                                      str(wfid.locationCode()),
-                                      str(wfid.channelCode()),
-                                      str(pick.time().value()) ))
-    
-        try:   
-            # USE https://github.com/SeisComP/main/blob/b591e0de56fa85434b60ba306ec4df794713a175/apps/python/sh2proc.py#L161 INSTEAD     OR
-            # https://github.com/SeisComP/main/blob/b591e0de56fa85434b60ba306ec4df794713a175/apps/python/scevtstreams.py#L286 
-            
-            #self.dbr = datamodel.DatabaseReader(self.database())
-            self.inv = client.Inventory.Instance().inventory()    
-            #self.dbr.loadNetworks(self.inv)
-            nnet = self.inv.networkCount()
-            for inet in range(nnet):
-                net = self.inv.network(inet)
-                if str(net.code()) != str(wfid.networkCode()):
-                    continue
-
-                debug("Network {:2} ".format(net.code()))                
-
-                #self.dbr.load(net)
-                nsta = net.stationCount()
-                for ista in range(nsta):
-                    sta = net.station(ista)
-                    if str(sta.code()) != str(wfid.stationCode()):
-                        continue
-
-                    if not self.is_staloccha_availableattime( sta, pick ):   
-                        continue         
-                    
-                    debug("Station {:5} ".format(sta.code()))
-
-                    #self.dbr.load(sta)
-                    nloc = sta.sensorLocationCount()*self.enable_loc_clust
-                    for iloc in range(nloc):
-                        loc = sta.sensorLocation(iloc)
-                        if str(loc.code()) != str(wfid.locationCode()):
-                            continue
-                        
-                        if not self.is_staloccha_availableattime( loc, pick ):   
-                            continue                           
-                        
-                        debug("Location '{:2}' ".format(loc.code()))
-
-                        #self.dbr.load(loc)
-                        ncha = loc.streamCount()*self.enable_cha_clust 
-                        for icha in range(ncha):
-                            cha = loc.stream(icha)
-                            if str(cha.code()) != str(wfid.channelCode()):
-                                continue
-                            
-                            if not self.is_staloccha_availableattime( cha, pick ):   
-                                continue                   
-
-                            debug("Channel {:3}".format(cha.code()))            
-                               
-                            if "latitude" in dir(cha) and "longitude" in dir(cha)  and "elevation" in dir(cha):                             
-                                info("Channel: {:9.4f} {:9.4f} {:9.4f}".format( cha.latitude(), 
-                                                                                cha.longitude(), 
-                                                                                cha.elevation() ))
-                                
-                                return {'la':cha.latitude(),
-                                        'lo':cha.longitude(),
-                                         'el':cha.elevation()}
-                               
-                        if "latitude" in dir(loc) and "longitude" in dir(loc) and "elevation" in dir(loc):                             
-                            info("Location: {:9.4f} {:9.4f} {:9.4f}".format( loc.latitude(), 
-                                                                             loc.longitude(), 
-                                                                             loc.elevation() ))
-                            
-                            return {'la':loc.latitude(),
-                                    'lo':loc.longitude(),
-                                    'el':loc.elevation()}
-                    
-                    if "latitude" in dir(sta) and "longitude" in dir(sta) and "elevation" in dir(sta):                             
-                        info("Station: {:9.4f} {:9.4f} {:9.4f}".format( sta.latitude(), 
-                                                                        sta.longitude(), 
-                                                                        sta.elevation() ))
-                        
-                        return {'la':sta.latitude(),
-                                'lo':sta.longitude(),
-                                'el':sta.elevation()}
-
+        return PickRecord(pick.publicID(),
+                          time2float(pick.time().value()),
+                          wfid.networkCode(),
+                          wfid.stationCode(),
+                          wfid.locationCode(),
+                          wfid.channelCode(),
+                          pick)
+
+    def associator_configure(self):
+        for name in ( 'max_buffer_interval', 'max_pick_delay', 'max_pick_distance', 'min_pick_distance',
+                      'enable_loc_clust', 'enable_cha_clust', 'enable_same_id_clust', 'enable_clust_merge',
+                      'incremental_association', 'release_first_delay', 'release_hold_off' ):
+            setattr(self.associator, name, getattr(self, name))
+
+    def station_index_build(self):
+        # once with the inventory loaded at startup, inventory updates are
+        # not subscribed to and need a restart
+        # USE https://github.com/SeisComP/main/blob/b591e0de56fa85434b60ba306ec4df794713a175/apps/python/sh2proc.py#L161 INSTEAD     OR
+        # https://github.com/SeisComP/main/blob/b591e0de56fa85434b60ba306ec4df794713a175/apps/python/scevtstreams.py#L286
+        try:
+            self.inv = client.Inventory.Instance().inventory()
+            self.associator.station_index = StationIndex(self.inv)
+            self.associator.station_index.update_neighbours(self.min_pick_distance,
+                                                            self.max_pick_distance)
         except Exception:
             traceback.print_exc()
             error("Cannot access station inventory")
             sys.exit(-1)
-        
-        return False
-
-    def buffer_min(self):
-        return min([ pick.time().value() for pick in self.pick_buffer ])
-    def buffer_max(self):
-        return max([ pick.time().value() for pick in self.pick_buffer ])
-    def buffer_len(self):
-        return len( self.pick_buffer )
-    
-    def mseedid(self,pick):
-
-        wfid = pick.waveformID()
-
-        mseedid = '%s.%s'%( str(wfid.networkCode()),
-                                str(wfid.stationCode()))
-        
-        if self.enable_loc_clust :
-            mseedid += '.'+str(wfid.locationCode())
-        
-        if self.enable_cha_clust :
-            mseedid += '.'+str(wfid.channelCode())
-
-        return mseedid
-            
-
-    def buffer_scan(self):
-        
-        self.release = []
-        for p1,pick1 in enumerate(self.pick_buffer):
-            for p2,pick2 in enumerate(self.pick_buffer):
-
-                if p2==p1:
-                    #SAME PICK
-                    break
-                
-                mseedid1 = self.mseedid(pick1)
-                mseedid2 = self.mseedid(pick2)
-
-                if mseedid1 == mseedid2 and not self.enable_same_id_clust:
-                    # SAME NET, STAT (, LOC (,CHA))
-                    continue
-
-                # check if picks are already clustered
-                pick1clust = [ c for c,clust in enumerate(self.clusters) if pick1 in clust.picks ]
-                pick2clust = [ c for c,clust in enumerate(self.clusters) if pick2 in clust.picks ]
-
-                if len(pick2clust)>1 or len(pick1clust)>1:
-                    error('PICKS DUPLICATED IN CLUSTERS')
-                if len(pick2clust) and len(pick1clust):
-                    continue # both already clustered
-
-
-                # check pick times similarity
-                dt = float( pick1.time().value() - pick2.time().value() )
-                if abs(dt) > self.max_pick_delay:
-                    continue
-
-                # check pick locations distance
-                elat = pick1.la
-                elon = pick1.lo
-                slat = pick2.la
-                slon = pick2.lo
-                delta = delazi_wgs84(elat, elon, slat, slon)[0] * 110.0
-                if delta > self.max_pick_distance:
-                    continue
-                if  delta < self.min_pick_distance:
-                    continue
-
-                
-                # Add picks into clusters
-                if len(pick1clust) and not len(pick2clust):
-                    # check if mseedid are already in clust
-                    if not self.enable_same_id_clust and mseedid2 in [ self.mseedid(p) for p in self.clusters[pick1clust[0]].picks ]:
-                        debug('{} already in cluster {}'.format( mseedid2, pick1clust[0] ))
-                        continue
-
-                    info('Upgrading cluster {} '.format(pick1clust[0]))
-                    info('With {}'.format(mseedid2))
-                    self.clusters[pick1clust[0]].picks += [ pick2 ]
-                    self.release += [ pick1clust[0] ]
-
-                elif len(pick2clust) and not len(pick1clust):
-                    # check if mseedid are already in clust
-                    if not self.enable_same_id_clust and mseedid1 in [ self.mseedid(p) for p in self.clusters[pick2clust[0]].picks ]:
-                        debug('{} already in cluster {}'.format( mseedid1, pick2clust[0] ))
-                        continue
-
-                    info('Upgrading cluster {} '.format(pick2clust[0]))
-                    info('With {}'.format(mseedid1))
-                    self.clusters[pick2clust[0]].picks += [ pick1 ]
-                    self.release += [ pick2clust[0] ]
 
-                else:
-                    info('New cluster')
-                    info('With both {} and {}'.format( mseedid1, mseedid2 ))
-                    self.clusters += [ Cluster( pick1, pick2 ) ]
-                    self.release += [ len(self.clusters)-1 ]
-
-                debug('{} versus {}'.format( mseedid1, mseedid2 ))
-                debug('%.2f = %s - %s' % ( dt,str(pick1.time().value()), str(pick2.time().value()) ))
-                debug('%.3f = delazi_wgs84( %.4f, %.4f, %.4f, %.4f )' % ( delta, elat, elon, slat, slon ))
-
-        self.release = list(set(self.release))
-        info('. '.join([ 'Cluster #%d with %d picks' % ( i, c.len() ) for i,c in enumerate(self.clusters) ]))
-        info('Cluster(s) to release: %s' % (', '.join([ '#%d' % i for i in self.release ])))
+        info('Station index: %d streams with coordinates' % len(self.associator.station_index))
 
+    @timed('origins_release')
     def origins_release(self):        
 
-        for c in self.release:
-            
-            cluster = self.clusters[c]
-
-            # Get average of those centroids, weighted by the signed areas.
-            latlonel = average(cluster.get_coordinates(), 
-                               axis=0, 
-                               weights=cluster.get_weights()
-                               )
-            latlonel[2] /= -1000.
+        self.send_begin()
+        try:
+            self.associator.clusters_release( self.release_clock() )
+        finally:
+            self.send_flush()
+
+    def origins_expired(self):
+        # final origins of the clusters which expired, without --playback
+        # they are not released otherwise
+        if not self.associator.expired:
+            return
+        self.send_begin()
+        try:
+            for cluster in self.associator.expired:
+                self.cluster_release(cluster)
+        finally:
+            self.send_flush()
+
+    def release_clock(self):
+        # pick time in file mode, else system time
+        if self.inputFile is not None:
+            return self.associator.clock
+        return time2float(Time.GMT())
+
+    def cluster_dropped(self, cluster):
+        self.cluster_origins.pop(self.associator.release_key(cluster), None)
+
+    def cluster_time(self, cluster):
+        # origin time, exact time of the first pick
+        return cluster.first.pick.time().value()
+
+    def cluster_release(self, cluster):
+
+        weights = cluster.get_weights()
+        key = self.associator.release_key(cluster)
+
+        # Get average of those centroids, weighted by the signed areas.
+        latlonel = average(cluster.get_coordinates(), 
+                           axis=0, 
+                           weights=weights
+                           )
+        latlonel[2] /= -1000.
+        if self.update_origins and self.inputFile is None:
+            origin = self.update_origin(key,
+                                        *latlonel,
+                                        self.cluster_time(cluster),
+                                        cluster.picks,
+                                        weights)
+        else:
             origin = self.make_origin(*latlonel, 
-                                      cluster.time_min(), 
+                                      self.cluster_time(cluster), 
                                       cluster.picks, 
-                                      cluster.get_weights())
-            
-            origin.setMethodID('weighted average')
-            origin.setType(datamodel.CENTROID)
-
-            info('Origin (weighted average centroid):')
-            info('  %.4f°N %.4f°E %.3f km bsl at %s' % ( latlonel[0], 
-                                                         latlonel[1], 
-                                                         latlonel[2], 
-                                                         str(cluster.time_min()) ))
-            info('   picks mseedids: %s' % ( str(cluster.get_ids()) ))
-            info('   picks weigths: %s' % ( str(cluster.get_weights()) ))
-            info('   picks (lat,lon,el): %s' % ( str(cluster.get_coordinates()) ))
-
-            if self.release_cluster :
-                #release origin with cluster release
-                self.send_origin( origin )
-
-            if self.release_location :
-                #release origin with located cluster
-                # https://github.com/SeisComP/scdlpicker/blob/ad7354f18034a3ea8a4af65c7067a67cddb2aaa5/lib/relocation.py#L89
-                # https://github.com/swiss-seismological-service/sed-SeisComP-contributions/blob/6014f671a85ad4a69d3b3380e1abfcabf10c9d17/apps/screloc/main.cpp#L170C26-L170C41
-                self.send_origin( origin )
-
+                                      weights)
+        
+        origin.setMethodID('weighted average')
+        origin.setType(datamodel.CENTROID)
+
+        info('Origin (weighted average centroid):')
+        info('  %.4f°N %.4f°E %.3f km bsl at %s' % ( latlonel[0], 
+                                                     latlonel[1], 
+                                                     latlonel[2], 
+                                                     str(self.cluster_time(cluster)) ))
+        info('   picks mseedids: %s' % ( str(cluster.get_ids(self.associator.stream_names)) ))
+        info('   picks weigths: %s' % ( str(weights) ))
+        info('   picks (lat,lon,el): %s' % ( str(cluster.get_coordinates()) ))
+
+        if self.release_cluster :
+            #release origin with cluster release
+            self.send_origin( origin, key )
+
+        if self.release_location :
+            #release origin with located cluster
+            # https://github.com/SeisComP/scdlpicker/blob/ad7354f18034a3ea8a4af65c7067a67cddb2aaa5/lib/relocation.py#L89
+            # https://github.com/swiss-seismological-service/sed-SeisComP-contributions/blob/6014f671a85ad4a69d3b3380e1abfcabf10c9d17/apps/screloc/main.cpp#L170C26-L170C41
+            self.send_origin( origin, key )
+
+    @timed('make_origin')
     def make_origin(self, lat, lon, dep, time, picks, weightpicks):
 
         origin = datamodel.Origin.Create()
@@ -555,64 +717,223 @@ class PickListener(client.Application):
         origin.setEvaluationStatus(datamodel.PRELIMINARY)
 
         for p,pick in enumerate(picks):
-                phase = datamodel.Phase()
-                phase.setCode(self.default_phase_type)
-                arr = datamodel.Arrival()
-                arr.setPhase(phase)
-                arr.setPickID(pick.publicID())
-                arr.setTimeUsed(True)
-                arr.setWeight(weightpicks[p])
-                origin.add(arr)
-                debug("{} added".format(pick.publicID()))
+                origin.add(self.make_arrival(pick, weightpicks[p]))
+                debug("{} added".format(pick.publicid))
         
+        origin.setQuality(self.make_quality(picks))
+        
+        return origin
+
+    def make_arrival(self, pick, weight):
+
+        phase = datamodel.Phase()
+        phase.setCode(self.default_phase_type)
+        arr = datamodel.Arrival()
+        arr.setPhase(phase)
+        arr.setPickID(pick.publicid)
+        arr.setTimeUsed(True)
+        arr.setWeight(weight)
+        return arr
+
+    def make_quality(self, picks):
+
         oq = datamodel.OriginQuality()
         oq.setAssociatedPhaseCount(len(picks))
         oq.setUsedPhaseCount(len(picks))
-        oq.setAssociatedStationCount(p+1)
-        oq.setUsedStationCount(p+1)
+        oq.setAssociatedStationCount(len(picks))
+        oq.setUsedStationCount(len(picks))
         #oq.setAzimuthalGap()
         #oq.setSecondaryAzimuthalGap()
         #oq.setMaximumDistance()
         #oq.setMinimumDistance()
         #oq.setMedianDistance()
         #oq.setStandardError()#RMS of the travel time residuals of the arrivals used for the origin computation in seconds.
-        origin.setQuality(oq)
-        
-        return origin
+        return oq
+
+    @timed('update_origin')
+    def update_origin(self, key, lat, lon, dep, time, picks, weightpicks):
+        """
+        Origin of the cluster, created on its first release and updated in
+        place afterwards. Changes are recorded by arrival pickID until the
+        origin is sent, see changes_notifiers. Arrivals keep the weight they
+        were added with: weights are relative to the cluster bounds, updating
+        them would update almost every arrival on every growth.
+        """
+        origin = self.cluster_origins.get(key)
+        if origin is None:
+            origin = self.make_origin(lat, lon, dep, time, picks, weightpicks)
+            self.cluster_origins[key] = origin
+            self.origin_changes[origin.publicID()] = {'new': True, 'added': set(), 'removed': []}
+            return origin
+
+        changes = self.origin_changes.setdefault(origin.publicID(),
+                                                 {'new': False, 'added': set(), 'removed': []})
+
+        ci = origin.creationInfo()
+        ci.setModificationTime(Time.GMT())
+        origin.setCreationInfo(ci)
 
+        origin.setLongitude(datamodel.RealQuantity(lon))
+        origin.setLatitude(datamodel.RealQuantity(lat))
+        origin.setDepth(datamodel.RealQuantity(dep))
+        origin.setTime(datamodel.TimeQuantity(time))
 
-    def send_origin(self, origin):
+        arrivals = dict([ (origin.arrival(i).pickID(), origin.arrival(i)) for i in range(origin.arrivalCount()) ])
+        for p,pick in enumerate(picks):
+            arr = arrivals.get(pick.publicid)
+            if arr is None:
+                origin.add(self.make_arrival(pick, weightpicks[p]))
+                changes['added'].add(pick.publicid)
+                debug("{} added".format(pick.publicid))
+
+        # picks which left the cluster
+        pickids = set([ pick.publicid for pick in picks ])
+        for pickid, arr in arrivals.items():
+            if pickid not in pickids:
+                origin.remove(arr)
+                if pickid in changes['added']:
+                    # never sent
+                    changes['added'].discard(pickid)
+                else:
+                    changes['removed'] += [ arr ]
+                debug("{} removed".format(pickid))
+
+        origin.setQuality(self.make_quality(picks))
+
+        return origin
+
+    def changes_notifiers(self, origin):
+        """
+        Notifiers of the recorded changes: OP_ADD of a new origin with its
+        arrivals, else OP_UPDATE of the origin, OP_ADD of new arrivals and
+        OP_REMOVE of arrivals of picks which left the cluster. They carry
+        copies, the origin keeps changing while they wait in the send queue.
+        """
+        changes = self.origin_changes.pop(origin.publicID(), None)
+        copy = datamodel.Origin.Cast(origin.clone())
+        if changes is not None and changes['new']:
+            added = None
+            notifiers = [ datamodel.Notifier("EventParameters", datamodel.OP_ADD, copy) ]
+        else:
+            notifiers = [ datamodel.Notifier("EventParameters", datamodel.OP_UPDATE, copy) ]
+            if changes is None:
+                return notifiers
+            added = changes['added']
+            # removals first, a pick may have left and joined again
+            for arr in changes['removed']:
+                notifiers += [ datamodel.Notifier(origin.publicID(), datamodel.OP_REMOVE, arr) ]
+
+        for i in range(origin.arrivalCount()):
+            arr = origin.arrival(i)
+            if added is None or arr.pickID() in added:
+                notifiers += [ datamodel.Notifier(origin.publicID(), datamodel.OP_ADD,
+                                                  datamodel.Arrival.Cast(arr.clone())) ]
+
+        return notifiers
+
+    @timed('send_origin')
+    def send_origin(self, origin, key=None):
         
         if self.inputFile is not None:
-            self.ep = datamodel.EventParameters()
-            self.ep.add(origin)
+            self.origin_writer.write(origin)
+            return True
+
+        if self.release_todatabase and self.send_batch is not None:
+            # sent with the batch, once
+            if not [ o for o, k in self.send_batch if o is origin ]:
+                self.send_batch += [ (origin, key) ]
             return True
 
+        return self.send_parts([ (key, self.origin_part(origin)) ])
+
+    def origin_part(self, origin):
+        # notifiers of the origin, to be sent alone or with a batch, or a
+        # message of its own
         if self.release_todatabase:
-            if False:
-                msg = datamodel.NotifierMessage()
-                n = datamodel.Notifier("EventParameters",datamodel.OP_ADD, origin)
-                msg.attach(n)
-            else:
-                self.ep = datamodel.EventParameters()
-                datamodel.Notifier.Enable()
-                self.ep.add(origin)
-                msg = datamodel.Notifier.GetMessage()
-                datamodel.Notifier.Disable()
-            
-        else:
-            msg = datamodel.ArtificialOriginMessage(origin)
+            if self.update_origins and self.inputFile is None:
+                return self.changes_notifiers(origin)
+            return self.origin_notifiers(origin)
+
+        if self.update_origins and self.inputFile is None:
+            # the origin keeps changing while the message waits
+            origin = self.origin_copy(origin)
+        return datamodel.ArtificialOriginMessage(origin)
+
+    def origin_copy(self, origin):
+        copy = datamodel.Origin.Cast(origin.clone())
+        for i in range(origin.arrivalCount()):
+            copy.add(datamodel.Arrival.Cast(origin.arrival(i).clone()))
+        return copy
+
+    def origin_notifiers(self, origin):
+        # as made by EventParameters.add(origin) with notifiers enabled,
+        # without touching the global notifier state from several threads
+        notifiers = [ datamodel.Notifier("EventParameters", datamodel.OP_ADD, origin) ]
+        for i in range(origin.arrivalCount()):
+            notifiers += [ datamodel.Notifier(origin.publicID(), datamodel.OP_ADD, origin.arrival(i)) ]
+        return notifiers
+
+    def parts_message(self, parts):
+        if len(parts) == 1 and not isinstance(parts[0], list):
+            return parts[0]
+
+        msg = datamodel.NotifierMessage()
+        for notifiers in parts:
+            for notifier in notifiers:
+                msg.attach(notifier)
+        return msg
+
+    def send_parts(self, parts):
+        # (cluster key, origin part) pairs sent in one message, origins of
+        # the same cluster may be coalesced in the send queue
+        
+        if self.send_queue is not None:
+            if self.update_origins:
+                # changes of updated origins are sent once, never replaced
+                parts = [ (None, part) for key, part in parts ]
+            return self.send_queue.put(parts)
+
+        return self.parts_send(parts)
+
+    def parts_send(self, parts):
+        return self.message_send( self.parts_message([ part for key, part in parts ]), len(parts) )
+
+    def message_send(self, msg, count):
         
         if not self.test:
             if self.connection().send(msg):
-                info("sent origin")# + origin.publicID()) #seiscomp.logging.info
+                info("sent %d origin(s)" % count)# + origin.publicID()) #seiscomp.logging.info
+                self.sent_messages += 1
+                self.sent_origins += count
             else:
                 error("failed to send")# + origin.publicID()) #seiscomp.logging.info
         else:
             info('TEST MODE, ORIGIN NOT SENT')        
 
         return True
-    
+
+    def send_begin(self):
+        # origins sent from now on are collected into one message
+        if self.batch_origins and self.send_batch is None:
+            self.send_batch = []
+            self.send_batch_start = time.time()
+
+    def send_flush(self, force=False):
+        if self.send_batch is None:
+            return
+        if not force and time.time() - self.send_batch_start < self.batch_interval:
+            return
+
+        batch = self.send_batch
+        self.send_batch = None
+        if not batch:
+            return
+
+        self.send_parts([ (key, self.origin_part(origin)) for origin, key in batch ])
+        self.calls_saved += len(batch) - 1
+        info('Batch of %d origins sent in one message, %d messaging calls saved in total' % (
+            len(batch), self.calls_saved ))
+
     def readXML(self):
 
         if self.inputFormat == "xml":
@@ -630,6 +951,7 @@ class PickListener(client.Application):
             raise IOError("unable to open input file")
 
         obj = ar.readObject()
+        ar.close()
         if obj is None:
             raise TypeError("invalid input file format")
 
@@ -641,48 +963,299 @@ class PickListener(client.Application):
         if ep.pickCount() == 0:
             raise ValueError("no pick found in input file")
 
-        pickIDs = []
-        # no event, use all available picks
-        for i in range(ep.pickCount()):
-            pickIDs += [ep.pick(i).publicID()]
+        # no event, use all available picks in time order, read once
+        records = [ self.pick_record(ep.pick(i)) for i in range(ep.pickCount()) ]
+        records.sort(key=lambda record: record.time)
 
-        # collect picks
-        picks = []
-        for pID in pickIDs:
-            p = datamodel.Pick.Find(pID)
-            if p is None:
-                continue
-            picks.append(p)
-            if len(picks)>5:
-                break
+        # keep the picks alive while they are processed
+        self.ep_input = ep
 
-        return picks
+        return records
     
-    def run(self):
+    def replay_reset(self):
+        # empty association state, inventory and configuration are kept
+        self.associator.reset()
 
-        # read picks from input file
-        if self.inputFile:
-            picks = self.readXML()
-            if not picks:
-                raise ValueError("Could not find picks in input file")
-            for pick in picks:
-                self.handlePick(pick)    
+    def replay_associate(self, record):
+        try:
+            self.associator.add( record )
+        except Exception:
+            traceback.print_exc()
+            self.associator.release = []
+
+    def replay_state(self, tlive):
+        # clusters which can still grow with picks later than tlive +
+        # max_pick_delay, and their earliest pick time
+        live = [ c for c in self.associator.clusters.values() if c.tmax() >= tlive ]
+        return ( frozenset([ tuple([ pick.publicid for pick in c.picks ]) for c in live ]),
+                 min([ c.tmin() for c in live ] + [ tlive ]) )
+
+    def cluster_snapshot(self, cluster):
+        return ( cluster.key,
+                 [ pick.publicid for pick in cluster.picks ],
+                 list(cluster.times),
+                 list(cluster.coordinates),
+                 cluster.get_ids(self.associator.stream_names) )
+
+    def cluster_restore(self, snapshot):
+        cluster = Cluster()
+        cluster.key = snapshot[0]
+        for publicid, t, coordinates, mseedid in zip(*snapshot[1:]):
+            cluster.add( self.replay_picks[publicid], t, coordinates, self.associator.stream_intern(mseedid) )
+        return cluster
+
+    def clusters_restore(self, snapshots, merged=()):
+        # clusters of a release snapshot, all to release, after the merges
+        # which preceded it
+        associator = self.associator
+        for key, into in merged:
+            associator.release_merge(key, into)
+        associator.clusters = dict([ (snapshot[0], self.cluster_restore(snapshot)) for snapshot in snapshots ])
+        associator.release = list(associator.clusters)
+
+    def replay_window(self, start, owned, stop):
+        """
+        Associates picks start to stop of the replay from an empty state,
+        picks before owned only warm the state up. Returns the live
+        clusters at owned and stop, the clusters merged and released by
+        each owned pick and the clusters of the last release, without
+        --playback the final states of the clusters which end within the
+        owned picks instead.
+        """
+        records = self.replay_records
+        times = self.replay_times
+        self.replay_reset()
+
+        for record in records[start:owned]:
+            self.replay_associate(record)
+        tlive = times[owned] - self.max_pick_delay
+        state = self.replay_state(tlive)
+
+        releases = []
+        final = []
+        for record in records[owned:stop]:
+            self.replay_associate(record)
+            if self.playback:
+                releases += [ ( list(self.associator.merged),
+                                [ self.cluster_snapshot(self.associator.clusters[c]) for c in self.associator.release ] ) ]
+            else:
+                final += [ self.cluster_snapshot(c) for c in self.associator.expired if c.tmax() >= tlive ]
+
+        if stop < len(records):
+            tend = times[stop] - self.max_pick_delay
+            end_state = self.replay_state(tend)
+        else:
+            tend = float('inf')
+            end_state = None
+
+        if self.playback:
+            final = [ self.cluster_snapshot(self.associator.clusters[c]) for c in self.associator.release ]
+        else:
+            # clusters which cannot grow any more, earlier ones belong to
+            # the preceding window
+            final += [ self.cluster_snapshot(c) for c in self.associator.clusters.values()
+                       if tlive <= c.tmax() < tend ]
+
+        return state, end_state, releases, final
+
+    def replay_parallel(self, picks):
+        """
+        Associates time windows of the picks in worker processes.
+
+        Each window is warmed up with the picks of the preceding
+        max_pick_delay. Where the clusters which can still grow at a window
+        boundary differ from those of the preceding window, the window is
+        associated again with a warm-up covering these clusters, doubled
+        on every further difference up to the beginning of the replay, so
+        the released origins are the ones of a serial replay.
+        """
+        global _replay_app
+
+        self.replay_records = picks
+        self.replay_times = [ record.time for record in self.replay_records ]
+        self.replay_picks = dict([ (record.publicid, record) for record in self.replay_records ])
+        times = self.replay_times
+
+        # window boundaries at distinct pick times
+        bounds = [ 0 ]
+        for k in range(1, self.jobs):
+            b = max(bounds[-1] + 1, len(picks) * k // self.jobs)
+            while b < len(picks) and times[b] == times[b-1]:
+                b += 1
+            if b < len(picks):
+                bounds += [ b ]
+        bounds += [ len(picks) ]
+
+        def warmup(k, overlap):
+            if k == 0:
+                return 0
+            return bisect_left(times, times[bounds[k]] - overlap)
+
+        overlaps = [ self.max_pick_delay ] * (len(bounds) - 1)
+        tasks = [ (warmup(k, overlaps[k]), bounds[k], bounds[k+1]) for k in range(len(bounds) - 1) ]
+
+        _replay_app = self
+        with multiprocessing.get_context('fork').Pool(self.jobs) as pool:
+            results = pool.map(replay_window, tasks)
+
+            # stitch windows in time order
+            for k in range(1, len(results)):
+                while results[k][0][0] != results[k-1][1][0] and tasks[k][0] > 0:
+                    covering = times[bounds[k]] - results[k-1][1][1] + self.max_pick_delay
+                    overlaps[k] = max(2 * overlaps[k], covering)
+                    tasks[k] = (warmup(k, overlaps[k]), bounds[k], bounds[k+1])
+                    warning('Replay window %d differs at its start, associating it again with %.0f s warm-up' % ( k, overlaps[k] ))
+                    results[k] = pool.apply(replay_window, (tasks[k],))
+        _replay_app = None
+
+        info('Replayed %d picks in %d windows, %d associated again' % ( len(picks),
+                                                                      len(results),
+                                                                      sum([ o > self.max_pick_delay for o in overlaps ]) ))
+
+        self.replay_reset()
+        associator = self.associator
+        for k, (state, end_state, releases, final) in enumerate(results):
+            for i, (merged, release) in enumerate(releases):
+                associator.clock = max(associator.clock, times[bounds[k] + i])
+                # restored clusters expire like associated ones, with their
+                # debouncing state
+                associator.clusters_expire(associator.clock)
+                self.clusters_restore(release, merged)
+                for cluster in associator.clusters.values():
+                    associator.cluster_expiry_push(cluster)
+                self.origins_release()
+
+        if self.playback:
+            # last release of the replay, for final origins
+            self.clusters_restore(results[-1][3])
+        else:
+            # final states of the clusters of all windows
+            self.clusters_restore(sum([ final for state, end_state, releases, final in results ], []))
+
+    def replay(self):
+
+        picks = self.readXML()
+        if not picks:
+            raise ValueError("Could not find picks in input file")
+
+        self.origin_writer = OriginWriter(self.outputFile)
+        try:
+            start = time.time()
+            if self.jobs > 1:
+                self.replay_parallel(picks)
+            else:
+                for record in picks:
+                    self.handleRecord(record)
+            elapsed = time.time() - start
+            info('Processed %d picks in %.3f s (%.1f picks/s)' % ( len(picks),
+                                                                 elapsed,
+                                                                 len(picks) / max(elapsed, 1e-9) ))
             
             if not self.playback :
-                # not cluster location released in real-time yet, release needed
+                # not cluster location released in real-time yet, final
+                # origins of all the live clusters, in time order
+                associator = self.associator
+                associator.release = sorted(associator.clusters, key=lambda key: associator.clusters[key].tmax())
                 self.origins_release()
 
-            ar = io.XMLArchive()
-            ar.create(self.outputFile)
-            ar.setFormattedOutput(True)
-            ar.writeObject(self.ep)            
-            ar.close()
+            # pending debounced releases
+            self.associator.release_due( float('inf') )
+        finally:
+            self.origin_writer.close()
+            self.stage_report()
+
+        return len(picks), elapsed
+
+    def batch_output(self, inputFile):
+        # the full input name, day1.xml and day1.zxml are distinct
+        name = os.path.basename(inputFile) + '.origins.xml'
+        if self.outputDir is not None:
+            return os.path.join(self.outputDir, name)
+        return os.path.join(os.path.dirname(inputFile), name)
+
+    def batch_file(self, inputFile):
+        # replays one batch file in a worker process
+        self.inputFile = inputFile
+        self.inputFormat = self.batchFormats[inputFile]
+        self.outputFile = self.batch_output(inputFile)
+        self.jobs = 1
+        self.replay_reset()
+        # stage times of this file only
+        self.stage_times.reset()
+        # release the picks of the previous file of this worker before
+        # reading the next one, their publicIDs stay registered while alive
+        self.ep_input = None
+        start = time.time()
+        try:
+            npicks, elapsed = self.replay()
+        except Exception as e:
+            traceback.print_exc()
+            return inputFile, 0, time.time() - start, str(e)
+        return inputFile, npicks, elapsed, None
+
+    def replay_batch(self):
+        """
+        Replays each batch file into its own output in a pool of worker
+        processes sharing the station index loaded at startup.
+        """
+        global _replay_app
+
+        info('Batch of %d files with %d workers' % ( len(self.batchFiles), self.jobs ))
+
+        start = time.time()
+        _replay_app = self
+        with multiprocessing.get_context('fork').Pool(self.jobs) as pool:
+            results = pool.map(batch_file, self.batchFiles, chunksize=1)
+        _replay_app = None
+        elapsed = time.time() - start
+
+        failed = 0
+        for inputFile, npicks, seconds, err in results:
+            if err is not None:
+                failed += 1
+                error('%s: failed after %.3f s: %s' % ( inputFile, seconds, err ))
+                continue
+            info('%s: %d picks in %.3f s (%.1f picks/s) -> %s' % ( inputFile,
+                                                                   npicks,
+                                                                   seconds,
+                                                                   npicks / max(seconds, 1e-9),
+                                                                   self.batch_output(inputFile) ))
+
+        npicks = sum([ r[1] for r in results ])
+        info('Batch processed %d picks of %d files in %.3f s (%.1f picks/s), %d failed' % ( npicks,
+                                                                                          len(results),
+                                                                                          elapsed,
+                                                                                          npicks / max(elapsed, 1e-9),
+                                                                                          failed ))
+        return failed == 0
+
+    def run(self):
+
+        # read picks from batch files
+        if self.batchFiles:
+            return self.replay_batch()
+
+        # read picks from input file
+        if self.inputFile:
+            self.replay()
             return True
             
         info("Hi! The pick listener is now running.")
         return client.Application.run(self)
 
 
+# PickListener replaying in forked worker processes
+_replay_app = None
+
+
+def replay_window(task):
+    return _replay_app.replay_window(*task)
+
+
+def batch_file(inputFile):
+    return _replay_app.batch_file(inputFile)
+
+
 def main():
     app = PickListener(len(sys.argv), sys.argv)
     return app()
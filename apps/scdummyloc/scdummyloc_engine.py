@@ -0,0 +1,1129 @@
+# -*- coding: utf-8 -*-
+"""
+Pick association engine of scdummyloc.
+
+Works on PickRecords, plain picks converted once at ingest, and does not
+need SeisComP: inventories are read through their accessors only, logs
+go to the Python logging module and distances are computed with NumPy
+where seiscomp is not available. PickListener in scdummyloc.py adapts
+the engine to the messaging system and the SeisComP data model.
+"""
+
+import time
+import heapq
+import itertools
+import numpy as np
+
+try:
+    from seiscomp.math import delazi_wgs84
+    from seiscomp.logging import info, debug, warning, error
+except ImportError:
+    import logging
+    delazi_wgs84 = None
+    _logger = logging.getLogger('scdummyloc')
+    info, debug, warning, error = _logger.info, _logger.debug, _logger.warning, _logger.error
+
+class PickRecord(object):
+    """
+    Pick as seen by the association, converted once at ingest: publicID,
+    time in epoch seconds and stream codes. sid is the interned stream id,
+    set when the record is first buffered. pick keeps the object the
+    record was made of for the adapter, the engine never touches it.
+    """
+
+    __slots__ = ( 'publicid', 'time', 'net', 'sta', 'loc', 'cha', 'sid', 'pick' )
+
+    def __init__(self, publicid, time, net, sta, loc='', cha='', pick=None):
+        self.publicid = publicid
+        self.time = time
+        self.net = net
+        self.sta = sta
+        self.loc = loc
+        self.cha = cha
+        self.sid = None
+        self.pick = pick
+
+
+class Cluster(object):
+    """
+    Clustered pick records with time bounds and stream ids updated as picks
+    join, are replaced or leave. key defaults to the publicID of the first
+    pick which joined and does not change afterwards. A cluster merged into
+    another one is left empty with parent pointing to it.
+    """
+
+    __slots__ = ( 'picks', 'times', 'coordinates', 'sids', 'ids', 'first', '_tmin', '_tmax',
+                  'key', 'parent', 'created', 'released', 'due' )
+
+    def __init__(self):
+        self.picks = []
+        self.times = []
+        self.coordinates = []
+        self.sids = []
+        self.ids = set()
+        self.first = None
+        self._tmin = None
+        self._tmax = None
+        self.key = None
+        self.parent = None
+        # release clock times of creation, last release and pending release
+        self.created = None
+        self.released = None
+        self.due = None
+
+    def add(self, pick, t, coordinates, sid):
+        if self.key is None:
+            self.key = pick.publicid
+        self.picks.append( pick )
+        self.times.append( t )
+        self.coordinates.append( coordinates )
+        self.sids.append( sid )
+        self.ids.add( sid )
+        if self.first is None or t < self._tmin:
+            self.first = pick
+            self._tmin = t
+        if self._tmax is None or t > self._tmax:
+            self._tmax = t
+
+    def replace(self, old, pick, t, coordinates, sid):
+        # new revision of a pick, at its place
+        i = self.picks.index( old )
+        self.picks[i] = pick
+        self.times[i] = t
+        self.coordinates[i] = coordinates
+        self.sids[i] = sid
+        self.bounds()
+
+    def remove(self, pick):
+        i = self.picks.index( pick )
+        for values in ( self.picks, self.times, self.coordinates, self.sids ):
+            del values[i]
+        self.bounds()
+
+    def absorb(self, other):
+        # picks of other join, other becomes a pointer to this cluster
+        for pick, t, coordinates, sid in zip( other.picks, other.times, other.coordinates, other.sids ):
+            self.add( pick, t, coordinates, sid )
+        other.picks, other.times, other.coordinates, other.sids = [], [], [], []
+        other.ids = set()
+        other.parent = self
+
+    def bounds(self):
+        # stream ids and time bounds from scratch, after a pick changed or left
+        self.ids = set( self.sids )
+        self.first = None
+        self._tmin = None
+        self._tmax = None
+        for pick, t in zip( self.picks, self.times ):
+            if self.first is None or t < self._tmin:
+                self.first = pick
+                self._tmin = t
+            if self._tmax is None or t > self._tmax:
+                self._tmax = t
+
+    def tmin( self ):
+        return self._tmin
+
+    def tmax( self ):
+        return self._tmax
+
+    def len( self ):
+        return len( self.picks )
+
+    def get_coordinates(self):            
+        return self.coordinates
+
+    def get_weights(self):
+        # weight should not reach 0
+        tmax = self._tmax
+        tnorm = tmax - self._tmin
+        return [ (tmax - t)/tnorm+0.01 for t in self.times ]
+    
+    def get_ids(self, names):
+        return [ names[sid] for sid in self.sids ]
+    
+
+# relative accuracy of distances_batch against delazi_wgs84
+DISTANCE_TOLERANCE = 0.01
+
+
+def distances_batch(lat1, lon1, lat2, lon2):
+    """
+    Distances in km between coordinate arrays, scaled as
+    delazi_wgs84(...)[0] * 110.
+
+    Great circles on a sphere ignore the WGS84 flattening, results agree
+    with delazi_wgs84 * 110 within DISTANCE_TOLERANCE (relative).
+    """
+    lat1, lon1, lat2, lon2 = [ np.radians(a) for a in (lat1, lon1, lat2, lon2) ]
+    # haversine, well conditioned for short distances
+    h = ( np.sin((lat2 - lat1) / 2)**2 +
+          np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2 )
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(h, 0., 1.)))) * 110.0
+
+
+def time2float(t):
+    # epoch seconds as plain float, avoids further SWIG calls in comparisons
+    return t.seconds() + t.microseconds() * 1e-6
+
+
+class StageTimes(object):
+    """
+    Call counts, total and maximal durations of the pick pipeline stages,
+    with the latest durations kept for percentiles. Stages nest, buffer_add
+    includes pick2chan and eviction for example.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+
+    def add(self, name, seconds):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = [ 0, 0., 0., np.empty(self.size) ]
+        stage[3][stage[0] % self.size] = seconds
+        stage[0] += 1
+        stage[1] += seconds
+        if seconds > stage[2]:
+            stage[2] = seconds
+
+    def summary(self):
+        lines = []
+        for name, (count, total, maximum, samples) in self.stages.items():
+            p50, p99 = np.percentile(samples[:min(count, self.size)], [ 50, 99 ]) * 1e3
+            lines += [ '%-16s %8d calls, total %.3f s, mean %.3f ms, p50 %.3f ms, p99 %.3f ms, max %.3f ms' % (
+                name, count, total, total / count * 1e3, p50, p99, maximum * 1e3 ) ]
+        return lines
+
+
+def timed(stage):
+    # records the duration of the method into the stage times of the application
+    def decorator(method):
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.stage_times.add(stage, time.perf_counter() - start)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorator
+
+
+class PickBuffer(object):
+    """
+    Columnar store of buffered picks sorted by time.
+
+    Time, coordinates, station node and stream id of the picks are kept in parallel
+    NumPy arrays, pick records and their publicIDs in side tables. Picks arriving
+    out of order are inserted at their place in time, picks with identical
+    times keep their arrival order. Eviction moves the head, the columns
+    are compacted or grown when they run full. Indices are relative to the
+    head. records maps publicIDs to the buffered records, one per pick.
+    """
+
+    columns = ( ('times', float), ('la', float), ('lo', float), ('el', float), ('node', int), ('sid', int) )
+
+    def __init__(self, capacity=1024):
+        self.head = 0
+        self.tail = 0
+        self.data = dict([ (name, np.empty(capacity, dtype)) for name, dtype in self.columns ])
+        self.picks = [ None ] * capacity
+        self.ids = [ None ] * capacity
+        self.records = {}
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def __iter__(self):
+        return iter(self.picks[self.head:self.tail])
+
+    def column(self, name):
+        return self.data[name][self.head:self.tail]
+
+    def pick(self, i):
+        return self.picks[self.head + i]
+
+    def publicid(self, i):
+        return self.ids[self.head + i]
+
+    def time(self, i):
+        return float(self.data['times'][self.head + i])
+
+    def node(self, i):
+        return int(self.data['node'][self.head + i])
+
+    def sid(self, i):
+        return int(self.data['sid'][self.head + i])
+
+    def coordinates(self, i):
+        i += self.head
+        return [ float(self.data['la'][i]), float(self.data['lo'][i]), float(self.data['el'][i]) ]
+
+    def reserve(self):
+        capacity = len(self.picks)
+        if self.tail < capacity:
+            return
+
+        n = len(self)
+        if 2 * n > capacity:
+            capacity *= 2
+
+        for name, dtype in self.columns:
+            data = np.empty(capacity, dtype)
+            data[:n] = self.data[name][self.head:self.tail]
+            self.data[name] = data
+        self.picks = self.picks[self.head:self.tail] + [ None ] * (capacity - n)
+        self.ids = self.ids[self.head:self.tail] + [ None ] * (capacity - n)
+        self.head = 0
+        self.tail = n
+
+    def add(self, pick, t, la, lo, el, node, sid):
+        self.reserve()
+
+        i = self.tail
+        if len(self) and t < self.data['times'][i-1]:
+            # late pick, shift the later ones
+            i = self.head + int(np.searchsorted(self.column('times'), t, side='right'))
+            for data in self.data.values():
+                data[i+1:self.tail+1] = data[i:self.tail]
+            self.picks[i+1:self.tail+1] = self.picks[i:self.tail]
+            self.ids[i+1:self.tail+1] = self.ids[i:self.tail]
+
+        for name, value in zip(('times', 'la', 'lo', 'el', 'node', 'sid'), (t, la, lo, el, node, sid)):
+            self.data[name][i] = value
+        self.picks[i] = pick
+        self.ids[i] = pick.publicid
+        self.records[pick.publicid] = pick
+        self.tail += 1
+
+        return i - self.head
+
+    def get(self, publicid):
+        return self.records.get(publicid)
+
+    def remove(self, i):
+        # removes the pick at index i, shifts the later ones
+        i += self.head
+        del self.records[self.ids[i]]
+        for data in self.data.values():
+            data[i:self.tail-1] = data[i+1:self.tail]
+        self.picks[i:self.tail-1] = self.picks[i+1:self.tail]
+        self.ids[i:self.tail-1] = self.ids[i+1:self.tail]
+        self.tail -= 1
+        self.picks[self.tail] = None
+        self.ids[self.tail] = None
+
+    def find(self, pick, t):
+        times = self.column('times')
+        i = int(np.searchsorted(times, t, side='left'))
+        while i < len(times) and times[i] == t:
+            if self.pick(i) is pick:
+                return i
+            i += 1
+        return None
+
+    def window(self, t, delay):
+        # index range of picks within delay of t
+        times = self.column('times')
+        return ( int(np.searchsorted(times, t - delay, side='left')),
+                 int(np.searchsorted(times, t + delay, side='right')) )
+
+    def tmin(self):
+        return float(self.data['times'][self.head])
+
+    def tmax(self):
+        return float(self.data['times'][self.tail-1])
+
+    def evict(self, interval):
+        # picks older than interval before the latest pick
+        times = self.column('times')
+        tmax = times[-1]
+        n = int(np.searchsorted(times, tmax - interval, side='left'))
+        # exact with respect to rounding of tmax - interval
+        while n < len(times) and tmax - times[n] > interval:
+            n += 1
+        while n > 0 and not tmax - times[n-1] > interval:
+            n -= 1
+
+        removed = self.picks[self.head:self.head+n]
+        for pick in removed:
+            del self.records[pick.publicid]
+        self.picks[self.head:self.head+n] = [ None ] * n
+        self.ids[self.head:self.head+n] = [ None ] * n
+        self.head += n
+        return removed
+
+
+class StationIndex(object):
+    """
+    Inventory epochs and coordinates indexed by NET.STA(.LOC(.CHA)).
+
+    Each key holds a list of (start, end, node) entries, start and end in
+    epoch seconds. Epochs of sensor locations and streams are intersected
+    with their parents so that a single interval check tells whether the
+    whole chain was available at pick time. Nodes number the distinct
+    (lat, lon, el) positions, neighbours lists for each node the nodes
+    within the min/max pick distance ring.
+    """
+
+    def __init__(self, inventory=None):
+        self.epochs = {}
+        self.nodes = []
+        self.node_ids = {}
+        self.neighbours = []
+        self.neighbour_arrays = []
+        self.distances = None
+        if inventory is not None:
+            self.build(inventory)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def build(self, inventory):
+        self.epochs = {}
+        self.nodes = []
+        self.node_ids = {}
+        self.neighbours = []
+        self.neighbour_arrays = []
+        self.distances = None
+        for inet in range(inventory.networkCount()):
+            net = inventory.network(inet)
+            netcode = net.code()
+
+            for ista in range(net.stationCount()):
+                sta = net.station(ista)
+                staepoch = self.epoch(sta)
+                if staepoch is None:
+                    continue
+                stakey = '%s.%s' % ( netcode, sta.code() )
+                self.add(stakey, staepoch, self.coordinates(sta))
+
+                for iloc in range(sta.sensorLocationCount()):
+                    loc = sta.sensorLocation(iloc)
+                    locepoch = self.epoch(loc, staepoch)
+                    if locepoch is None:
+                        continue
+                    lockey = '%s.%s' % ( stakey, loc.code() )
+                    self.add(lockey, locepoch, self.coordinates(loc))
+
+                    for icha in range(loc.streamCount()):
+                        cha = loc.stream(icha)
+                        chaepoch = self.epoch(cha, locepoch)
+                        if chaepoch is None:
+                            continue
+                        chakey = '%s.%s' % ( lockey, cha.code() )
+                        self.add(chakey, chaepoch, self.coordinates(cha))
+
+        return self
+
+    def add(self, key, epoch, coordinates):
+        if coordinates is None:
+            return
+        if coordinates not in self.node_ids:
+            self.node_ids[coordinates] = len(self.nodes)
+            self.nodes.append(coordinates)
+        self.epochs.setdefault(key, []).append( epoch + (self.node_ids[coordinates],) )
+
+    def epoch(self, staloccha, parent=None):
+        try:
+            start = time2float(staloccha.start())
+        except Exception:
+            return None
+        try:
+            end = time2float(staloccha.end())
+        except Exception:
+            end = float('inf')
+
+        if parent is not None:
+            start = max(start, parent[0])
+            end = min(end, parent[1])
+            if start > end:
+                return None
+
+        return (start, end)
+
+    def coordinates(self, staloccha):
+        if not hasattr(staloccha, 'latitude'):
+            return None
+        try:
+            return (staloccha.latitude(),
+                    staloccha.longitude(),
+                    staloccha.elevation())
+        except Exception:
+            return None
+
+    def is_staloccha_availableattime(self, entry, t):
+        return entry[0] <= t <= entry[1]
+
+    def find(self, key, t):
+        for entry in self.epochs.get(key, ()):
+            if self.is_staloccha_availableattime(entry, t):
+                return entry[2]
+        return None
+
+    def lookup(self, net, sta, loc, cha, t, enable_loc=True, enable_cha=False):
+        """
+        Node of the deepest inventory level with coordinates available at
+        time t, or None if the station is unknown.
+        """
+        key = '%s.%s' % ( net, sta )
+        keys = [ key ]
+        if enable_loc:
+            keys += [ '%s.%s' % ( key, loc ) ]
+            if enable_cha:
+                keys += [ '%s.%s.%s' % ( key, loc, cha ) ]
+
+        for key in reversed(keys):
+            node = self.find(key, t)
+            if node is not None:
+                return node
+
+        return None
+
+    def update_neighbours(self, min_distance, max_distance):
+        """
+        Lists for each node the nodes from min_distance to max_distance km
+        away, only recomputed if the distances changed.
+        """
+        if self.distances == (min_distance, max_distance):
+            return self.neighbours
+
+        self.neighbours = [ set() for node in self.nodes ]
+        self.distances = (min_distance, max_distance)
+
+        if min_distance <= 0.:
+            for n1 in range(len(self.nodes)):
+                self.neighbours[n1].add(n1)
+
+        # batched distances decide pairs clearly inside or outside the ring,
+        # pairs within DISTANCE_TOLERANCE of a threshold get delazi_wgs84
+        # where SeisComP is available
+        inner = ( min_distance * (1 + DISTANCE_TOLERANCE), max_distance * (1 - DISTANCE_TOLERANCE) )
+        outer = ( min_distance * (1 - DISTANCE_TOLERANCE), max_distance * (1 + DISTANCE_TOLERANCE) )
+
+        for n1, n2, delta in self.candidate_distances(outer[1]):
+            inside = (delta >= inner[0]) & (delta <= inner[1])
+            for a, b in zip(n1[inside].tolist(), n2[inside].tolist()):
+                self.neighbours[a].add(b)
+                self.neighbours[b].add(a)
+
+            border = ~inside & (delta >= outer[0]) & (delta <= outer[1])
+            for a, b in zip(n1[border].tolist(), n2[border].tolist()):
+                la1, lo1 = self.nodes[a][:2]
+                la2, lo2 = self.nodes[b][:2]
+                if delazi_wgs84 is None:
+                    delta = float(distances_batch(la1, lo1, la2, lo2))
+                else:
+                    delta = delazi_wgs84(la1, lo1, la2, lo2)[0] * 110.0
+                if min_distance <= delta <= max_distance:
+                    self.neighbours[a].add(b)
+                    self.neighbours[b].add(a)
+
+        self.neighbour_arrays = [ np.array(sorted(n), dtype=int) for n in self.neighbours ]
+
+        info('Station graph: %d nodes, %d neighbour pairs within %.1f-%.1f km' % (
+            len(self.nodes),
+            sum([ len(n) for n in self.neighbours ]) // 2,
+            min_distance,
+            max_distance ))
+
+        return self.neighbours
+
+    def candidate_distances(self, max_distance, block=512):
+        """
+        Yields arrays of node pairs within a latitude band of max_distance
+        and their batched distances, a block of nodes at a time.
+        """
+        if not self.nodes:
+            return
+
+        coordinates = np.array(self.nodes)
+        order = np.argsort(coordinates[:,0], kind='stable')
+        lats = coordinates[order,0]
+        lons = coordinates[order,1]
+
+        # only nodes within a latitude band can be close enough
+        band = max_distance / 110.0 + 0.01
+        ends = np.searchsorted(lats, lats + band, side='right')
+
+        for b in range(0, len(order), block):
+            i = np.arange(b, min(b + block, len(order)))
+            counts = ends[i] - (i + 1)
+            total = counts.sum()
+            if not total:
+                continue
+
+            i1 = np.repeat(i, counts)
+            i2 = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + i1 + 1
+
+            yield ( order[i1],
+                    order[i2],
+                    distances_batch(lats[i1], lons[i1], lats[i2], lons[i2]) )
+
+
+class Associator(object):
+    """
+    Clusters pick records of neighbouring stations within max_pick_delay.
+
+    add() buffers a record and pairs it with the buffered ones. Clusters
+    are kept by key in clusters, the keys of the clusters to release are
+    listed in release, those of clusters merged into others in merged.
+    Clusters which expired with the pick are listed in expired. A record with the publicID of a buffered one is a
+    new revision of that pick and replaces it, see update().
+    clusters_release() passes them to the release callback, at once or
+    debounced by release_first_delay and release_hold_off against the given
+    clock. Clusters outdated by max_buffer_interval, found through a heap
+    of their end times, are passed to the drop callback before they are
+    forgotten.
+    """
+
+    def __init__(self, station_index=None, release=None, drop=None, stage_times=None):
+        self.station_index = station_index
+        self.release_callback = release
+        self.drop_callback = drop
+        self.stage_times = stage_times if stage_times is not None else StageTimes()
+        self.stream_ids = {}
+        self.stream_names = []
+
+        # Config, see PickListener
+        self.max_buffer_interval = 3*60*60.
+        self.max_pick_delay = 120.
+        self.max_pick_distance = 50.
+        self.min_pick_distance = 1.
+        self.enable_loc_clust = True
+        self.enable_cha_clust = False
+        self.enable_same_id_clust = False
+        self.enable_clust_merge = True
+        self.incremental_association = True
+        self.release_first_delay = 0.
+        self.release_hold_off = 0.
+
+        self.reset()
+
+    def reset(self):
+        # empty association state, stations and configuration are kept
+        self.pick_buffer = PickBuffer()
+        self.clusters = {}
+        # (end time, push count, cluster), outdated entries are skipped
+        self.cluster_expiry = []
+        self.cluster_pushes = itertools.count()
+        self.pick_clusters = {}
+        self.release = []
+        self.merged = []
+        self.expired = []
+        self.release_clusters = {}
+        # (due time, push count, key) of pending releases, outdated entries
+        # are skipped
+        self.release_pending = []
+        self.clock = 0.
+
+    def add(self, record):
+        # buffers and associates a pick record, False if its station is unknown
+        if self.pick_buffer.get( record.publicid ) is not None:
+            return self.update( record )
+
+        self.release = []
+        self.merged = []
+        self.expired = []
+        if not self.buffer_add( record ):
+            return False
+        self.buffer_scan( record )
+        return True
+
+    @timed('update')
+    def update(self, record):
+        """
+        Replaces the buffered revision of the pick by record. Within its
+        cluster the pick is replaced in place as long as it still pairs with
+        one of the other picks, else it leaves the cluster, which is dropped
+        below two picks, and is associated like a new pick. A revision
+        evicted at once with the buffer leaves its cluster too. Only this
+        cluster is released again, the buffer is not scanned.
+        """
+        self.release = []
+        self.merged = []
+        self.expired = []
+        old = self.pick_buffer.get( record.publicid )
+        self.pick_buffer.remove( self.pick_buffer.find( old, old.time ) )
+        cluster = self.cluster_of( record.publicid )
+
+        if not self.buffer_add( record ):
+            if cluster is not None and self.cluster_of( record.publicid ) is cluster:
+                self.cluster_remove( cluster, old )
+                if cluster.key in self.clusters:
+                    self.release = [ cluster.key ]
+            return False
+
+        if self.cluster_of( record.publicid ) is not cluster:
+            # the cluster expired with the buffer
+            cluster = None
+
+        if cluster is not None:
+            # None if the revision is older than the buffer and was evicted
+            # at once, it leaves the cluster then
+            p = self.pick_buffer.find( record, record.time )
+            if p is not None and self.cluster_fits( cluster, old, p ):
+                info('Updating pick {} in cluster {}'.format( record.publicid, cluster.key ))
+                tmax = cluster.tmax()
+                cluster.replace( old,
+                                 record,
+                                 record.time,
+                                 self.pick_buffer.coordinates(p),
+                                 self.pick_buffer.sid(p) )
+                if cluster.tmax() != tmax:
+                    self.cluster_expiry_push( cluster )
+                self.release = [ cluster.key ]
+                return True
+
+            info('Pick {} leaves cluster {}'.format( record.publicid, cluster.key ))
+            self.cluster_remove( cluster, old )
+
+        self.buffer_scan( record )
+        if cluster is not None and cluster.key in self.clusters:
+            self.release = list(dict.fromkeys( self.release + [ cluster.key ] ))
+        return True
+
+    def cluster_fits(self, cluster, old, p):
+        # whether the buffered pick p pairs with a pick of cluster other than old
+        t = self.pick_buffer.time(p)
+        sid = self.pick_buffer.sid(p)
+        neighbours = self.station_index.update_neighbours(self.min_pick_distance,
+                                                          self.max_pick_distance)[self.pick_buffer.node(p)]
+        fits = False
+        for pick, t2, coordinates, sid2 in zip( cluster.picks, cluster.times, cluster.coordinates, cluster.sids ):
+            if pick is old:
+                continue
+            if sid2 == sid and not self.enable_same_id_clust:
+                return False
+            if ( abs(t - t2) <= self.max_pick_delay and
+                 self.station_index.node_ids.get(tuple(coordinates)) in neighbours ):
+                fits = True
+        return fits
+
+    def cluster_remove(self, cluster, pick):
+        # pick leaves the cluster, clusters of a single pick are dropped
+        del self.pick_clusters[pick.publicid]
+        tmax = cluster.tmax()
+        cluster.remove( pick )
+        if cluster.len() < 2:
+            self.cluster_drop( cluster )
+        elif cluster.tmax() != tmax:
+            self.cluster_expiry_push( cluster )
+
+    @timed('buffer_add')
+    def buffer_add(self, pick):
+
+        if ( sta := self.pick2chan( pick ) ) is False :
+            error('STATION %s.%s NOT IN INVENTORY' % ( pick.net, pick.sta ))
+            return False
+        
+        self.pick_buffer.add( pick,
+                              pick.time,
+                              sta['la'],
+                              sta['lo'],
+                              sta['el'],
+                              sta['node'],
+                              self.stream_id(pick) )
+        self.clock = max(self.clock, self.buffer_max())
+
+        debug('Buffer beginning: %s ending: %s lasting: %d s' % ( self.buffer_min(), self.buffer_max(), self.buffer_len() ))
+
+        start = time.perf_counter()
+        for removed in self.pick_buffer.evict( self.max_buffer_interval ):
+            debug("removed: {}".format(removed.publicid))
+
+        debug('in buffer for {}:'.format(pick.time,))
+        debug('Buffer beginning: %s ending: %s lasting: %d s' % ( self.buffer_min(), self.buffer_max(), self.buffer_len() ))
+
+        self.clusters_expire( self.buffer_max() )
+        self.stage_times.add('eviction', time.perf_counter() - start)
+        return True
+    
+    @timed('pick2chan')
+    def pick2chan(self, pick):
+
+        debug('%s.%s.%s.%s at %.6f' % ( pick.net, pick.sta, pick.loc, pick.cha, pick.time ))
+
+        node = self.station_index.lookup(pick.net,
+                                         pick.sta,
+                                         pick.loc,
+                                         pick.cha,
+                                         pick.time,
+                                         self.enable_loc_clust,
+                                         self.enable_cha_clust)
+        if node is None:
+            return False
+
+        coordinates = self.station_index.nodes[node]
+        debug("Coordinates: {:9.4f} {:9.4f} {:9.4f}".format( *coordinates ))
+
+        return {'la':coordinates[0],
+                'lo':coordinates[1],
+                'el':coordinates[2],
+                'node':node}
+
+    def buffer_min(self):
+        return self.pick_buffer.tmin()
+    def buffer_max(self):
+        return self.pick_buffer.tmax()
+    def buffer_len(self):
+        return len( self.pick_buffer )
+    
+    def cluster_add(self, cluster, *ps):
+        # add buffered picks by index
+        tmax = cluster.tmax()
+        for p in ps:
+            publicid = self.pick_buffer.publicid(p)
+            if publicid in self.pick_clusters:
+                error('PICKS DUPLICATED IN CLUSTERS')
+            self.pick_clusters[publicid] = cluster
+            cluster.add( self.pick_buffer.pick(p),
+                         self.pick_buffer.time(p),
+                         self.pick_buffer.coordinates(p),
+                         self.pick_buffer.sid(p) )
+        if cluster.tmax() != tmax:
+            self.cluster_expiry_push( cluster )
+        return cluster
+
+    def cluster_of(self, publicid):
+        # cluster of a pick, found through the clusters it was merged into
+        cluster = self.pick_clusters.get(publicid)
+        if cluster is None or cluster.parent is None:
+            return cluster
+        root = cluster
+        while root.parent is not None:
+            root = root.parent
+        # path compression
+        while cluster.parent is not None:
+            cluster.parent, cluster = root, cluster.parent
+        self.pick_clusters[publicid] = root
+        return root
+
+    def cluster_merge(self, cluster1, cluster2):
+        """
+        Merges two clusters bridged by a pick pair, the larger one absorbs
+        the other, which is dropped without a last release. Their keys are
+        listed in merged as (absorbed, merged). Returns the merged cluster.
+        """
+        if cluster2.len() > cluster1.len():
+            cluster1, cluster2 = cluster2, cluster1
+        info('Merging cluster {} into cluster {}'.format( cluster2.key, cluster1.key ))
+
+        key = cluster2.key
+        if self.release_clusters.get(key) is cluster2:
+            del self.release_clusters[key]
+        if self.drop_callback is not None:
+            self.drop_callback( cluster2 )
+        del self.clusters[key]
+        self.release = [ c for c in self.release if c != key ]
+        self.merged += [ ( key, cluster1.key ) ]
+        self.release_inherit( cluster1, cluster2 )
+
+        tmax = cluster1.tmax()
+        cluster1.absorb( cluster2 )
+        if cluster1.tmax() != tmax:
+            self.cluster_expiry_push( cluster1 )
+        return cluster1
+
+    def clusters_expire(self, t):
+        # drops the clusters ending max_buffer_interval before t
+        expiry = self.cluster_expiry
+        while expiry and t - expiry[0][0] > self.max_buffer_interval :
+            # OUTDATED CLUSTER (endtime<buffer starttime)
+            tmax, n, c = heapq.heappop(expiry)
+            if self.clusters.get(c.key) is c:
+                if c.tmax() == tmax:
+                    debug("removed: cluster ending on {}".format(tmax))
+                    self.cluster_drop(c)
+                    self.expired += [ c ]
+            else:
+                # debouncing state of a cluster restored from a snapshot
+                self.release_forget(c)
+
+    def cluster_expiry_push(self, cluster):
+        # new end time of the cluster, earlier entries become outdated
+        heapq.heappush( self.cluster_expiry, ( cluster.tmax(), next(self.cluster_pushes), cluster ) )
+
+    def cluster_new(self, p):
+        # keyed by the publicID of buffered pick p, which may have keyed a
+        # cluster it left
+        cluster = Cluster()
+        key = self.pick_buffer.publicid(p)
+        n = 1
+        while key in self.clusters:
+            key = '%s#%d' % ( self.pick_buffer.publicid(p), n )
+            n += 1
+        cluster.key = key
+        self.clusters[key] = cluster
+        return cluster
+
+    def cluster_drop(self, cluster):
+        key = self.release_key(cluster)
+        self.release_forget(cluster)
+        if self.drop_callback is not None:
+            self.drop_callback( cluster )
+        for pick in cluster.picks:
+            if self.cluster_of(pick.publicid) is cluster:
+                del self.pick_clusters[pick.publicid]
+        if self.clusters.get(key) is cluster:
+            del self.clusters[key]
+
+    def mseedid(self,pick):
+
+        mseedid = '%s.%s'%( pick.net, pick.sta )
+        
+        if self.enable_loc_clust :
+            mseedid += '.'+pick.loc
+        
+        if self.enable_cha_clust :
+            mseedid += '.'+pick.cha
+
+        return mseedid
+
+    def stream_id(self, pick):
+        # the id is made once per record, the clustering options are fixed by then
+        if pick.sid is None:
+            pick.sid = self.stream_intern(self.mseedid(pick))
+        return pick.sid
+
+    def stream_intern(self, mseedid):
+        # interned integer code of the mseedid
+        sid = self.stream_ids.get(mseedid)
+        if sid is None:
+            sid = self.stream_ids[mseedid] = len(self.stream_names)
+            self.stream_names += [ mseedid ]
+        return sid
+
+
+    def buffer_pairs(self):
+        # all pick pairs of the buffer, by index, which is in pick time
+        # order and not in arrival order
+        for p1 in range(len(self.pick_buffer)):
+            for p2 in range(p1):
+                yield p1, p2
+
+    def buffer_pairs_incremental(self, pick):
+        # pairs of the new pick with picks within max_pick_delay and
+        # max_pick_distance, in the order buffer_pairs would visit them
+        t = pick.time
+        p = self.pick_buffer.find(pick, t)
+        if p is None:
+            return
+
+        lo, hi = self.pick_buffer.window(t, self.max_pick_delay)
+        times = self.pick_buffer.column('times')[lo:hi]
+        nodes = self.pick_buffer.column('node')[lo:hi]
+        candidates = ( ( np.abs(times - t) <= self.max_pick_delay ) &
+                       np.isin(nodes, self.station_index.neighbour_arrays[self.pick_buffer.node(p)]) )
+        if not self.enable_same_id_clust:
+            candidates &= self.pick_buffer.column('sid')[lo:hi] != self.pick_buffer.sid(p)
+
+        for c in np.flatnonzero(candidates).tolist():
+            c += lo
+            if c < p:
+                yield p, c
+            elif c > p:
+                yield c, p
+
+    @timed('buffer_scan')
+    def buffer_scan(self, pick=None):
+
+        self.release = []
+
+        # no-op unless distance thresholds changed
+        self.neighbours = self.station_index.update_neighbours(self.min_pick_distance,
+                                                               self.max_pick_distance)
+
+        if pick is not None and self.incremental_association:
+            pairs = self.buffer_pairs_incremental(pick)
+        else:
+            pairs = self.buffer_pairs()
+
+        for p1, p2 in pairs:
+            self.buffer_associate(p1, p2)
+
+        self.release = list(dict.fromkeys(self.release))
+        info('Cluster(s) to release: %s' % (', '.join([ '%s with %d picks' % ( key, self.clusters[key].len() )
+                                                        for key in self.release ])))
+
+    def buffer_associate(self, p1, p2):
+        # associate buffered picks by index
+
+        sid1 = self.pick_buffer.sid(p1)
+        sid2 = self.pick_buffer.sid(p2)
+
+        if sid1 == sid2 and not self.enable_same_id_clust:
+            # SAME NET, STAT (, LOC (,CHA))
+            return
+
+        # check if picks are already clustered
+        clust1 = self.cluster_of(self.pick_buffer.publicid(p1))
+        clust2 = self.cluster_of(self.pick_buffer.publicid(p2))
+
+        if clust1 is not None and clust2 is not None:
+            if clust1 is clust2 or not self.enable_clust_merge:
+                return # both already clustered
+
+
+        # check pick times similarity
+        dt = self.pick_buffer.time(p1) - self.pick_buffer.time(p2)
+        if abs(dt) > self.max_pick_delay:
+            return
+
+        # check pick locations distance (min_pick_distance to max_pick_distance)
+        if self.pick_buffer.node(p2) not in self.neighbours[self.pick_buffer.node(p1)]:
+            return
+
+
+        mseedid1 = self.stream_names[sid1]
+        mseedid2 = self.stream_names[sid2]
+
+        # Add picks into clusters
+        if clust1 is not None and clust2 is not None:
+            # the pair bridges two clusters
+            if not self.enable_same_id_clust and clust1.ids & clust2.ids:
+                debug('clusters {} and {} share streams'.format( clust1.key, clust2.key ))
+                return
+
+            merged = self.cluster_merge( clust1, clust2 )
+            self.release += [ merged.key ]
+
+        elif clust1 is not None:
+            c = clust1.key
+            # check if mseedid are already in clust
+            if not self.enable_same_id_clust and sid2 in clust1.ids:
+                debug('{} already in cluster {}'.format( mseedid2, c ))
+                return
+
+            info('Upgrading cluster {} '.format(c))
+            info('With {}'.format(mseedid2))
+            self.cluster_add( clust1, p2 )
+            self.release += [ c ]
+
+        elif clust2 is not None:
+            c = clust2.key
+            # check if mseedid are already in clust
+            if not self.enable_same_id_clust and sid1 in clust2.ids:
+                debug('{} already in cluster {}'.format( mseedid1, c ))
+                return
+
+            info('Upgrading cluster {} '.format(c))
+            info('With {}'.format(mseedid1))
+            self.cluster_add( clust2, p1 )
+            self.release += [ c ]
+
+        else:
+            info('New cluster')
+            info('With both {} and {}'.format( mseedid1, mseedid2 ))
+            self.release += [ self.cluster_add( self.cluster_new(p1), p1, p2 ).key ]
+
+        debug('{} versus {}'.format( mseedid1, mseedid2 ))
+        debug('%.2f = %.2f - %.2f' % ( dt, self.pick_buffer.time(p1), self.pick_buffer.time(p2) ))
+        debug('neighbours ( %.4f, %.4f ) and ( %.4f, %.4f )' % ( *self.pick_buffer.coordinates(p1)[:2],
+                                                                 *self.pick_buffer.coordinates(p2)[:2] ))
+
+    def clusters_release(self, now):
+        # releases the clusters listed in release, debounced against now
+
+        if not self.release_debounced():
+            for c in self.release:
+                self.cluster_release( self.clusters[c] )
+            return
+
+        for c in self.release:
+            self.release_schedule( self.clusters[c], now )
+        self.release_due( now )
+
+    def release_debounced(self):
+        return self.release_first_delay > 0. or self.release_hold_off > 0.
+
+    def release_key(self, cluster):
+        # clusters restored from replay snapshots are new objects
+        return cluster.key
+
+    def release_inherit(self, cluster, absorbed):
+        # debouncing continues from the earliest state of both
+        due = cluster.due
+        for name, choose in ( ('created', min), ('released', max), ('due', min) ):
+            values = [ v for v in ( getattr(cluster, name), getattr(absorbed, name) ) if v is not None ]
+            setattr(cluster, name, choose(values) if values else None)
+        if cluster.due != due and self.release_clusters.get(self.release_key(cluster)) is cluster:
+            self.release_push(cluster)
+
+    def release_push(self, cluster):
+        # new due time of a pending cluster, earlier entries become outdated
+        heapq.heappush( self.release_pending, ( cluster.due, next(self.cluster_pushes), self.release_key(cluster) ) )
+
+    def release_forget(self, cluster):
+        # debouncing state of a cluster which is dropped
+        key = self.release_key(cluster)
+        if self.release_clusters.get(key) is cluster:
+            if cluster.due is not None:
+                # last state before the cluster is forgotten
+                self.release_now( cluster, cluster.due )
+            del self.release_clusters[key]
+
+    def release_merge(self, key, into):
+        """
+        Debouncing state of the cluster absorbed under key passes to the
+        cluster under into, as by cluster_merge(), for clusters merged
+        elsewhere and restored from replay snapshots.
+        """
+        absorbed = self.release_clusters.pop(key, None)
+        if absorbed is None:
+            return
+        if self.drop_callback is not None:
+            self.drop_callback( absorbed )
+        cluster = self.release_clusters.get(into)
+        if cluster is None:
+            # rescheduled with its restored state by the next release
+            cluster = Cluster()
+            cluster.key = into
+            self.release_clusters[into] = cluster
+        self.release_inherit( cluster, absorbed )
+
+    def release_schedule(self, cluster, now):
+        key = self.release_key(cluster)
+        previous = self.release_clusters.get(key)
+        pending = previous.due if previous is not None else None
+        if previous is not None and previous is not cluster:
+            cluster.created = previous.created
+            cluster.released = previous.released
+            cluster.due = previous.due
+        self.release_clusters[key] = cluster
+
+        if cluster.created is None:
+            cluster.created = now
+        if cluster.due is None:
+            if cluster.released is None:
+                cluster.due = cluster.created + self.release_first_delay
+            else:
+                cluster.due = max(now, cluster.released + self.release_hold_off)
+        # else already pending, its latest state will be released
+        if cluster.due != pending:
+            self.release_push(cluster)
+
+    def release_due(self, now):
+        # releases pending clusters due until now, in order of their due time
+        pending = self.release_pending
+        while pending and pending[0][0] <= now:
+            due, n, key = heapq.heappop(pending)
+            cluster = self.release_clusters.get(key)
+            if cluster is not None and cluster.due == due:
+                self.release_now( cluster, now )
+
+    def release_now(self, cluster, now):
+        debug('Releasing cluster due on %.3f' % cluster.due)
+        cluster.due = None
+        cluster.released = now
+        self.cluster_release( cluster )
+
+    def cluster_release(self, cluster):
+        if self.release_callback is not None:
+            self.release_callback( cluster )
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of scdummyloc on the SeisComP stand-in.
+
+A synthetic network with noise picks and a swarm is fed pick by pick to
+PickListener.handlePick as in online processing, once for each buffer
+size (max_buffer_interval). Reports picks/s, p50/p99 per-pick latency,
+peak memory and the mean pipeline stage times. Results can be saved to
+benchmarks/results/ and compared to an earlier run:
+
+    python benchmarks/bench.py --save
+    python benchmarks/bench.py --compare benchmarks/results/<earlier>.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import importlib.util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(HERE, '..', 'apps', 'scdummyloc', 'scdummyloc.py')
+sys.path[:0] = [ os.path.join(HERE, 'standin'), HERE, os.path.dirname(APP) ]
+
+import numpy as np
+from seiscomp import client
+import synthetic
+
+RESULTS = os.path.join(HERE, 'results')
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location('scdummyloc', APP)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['scdummyloc'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def scenario(args):
+    stations = synthetic.network(args.stations, extent=args.extent, seed=args.seed)
+    records = synthetic.noise(stations, 0., args.duration, args.noise_rate, seed=args.seed + 1)
+    for k in range(args.swarms):
+        # swarms around stations, spread over the duration
+        station = stations[(k * 7919) % len(stations)]
+        records += synthetic.swarm(stations,
+                                   args.duration * k / args.swarms,
+                                   args.duration / args.swarms,
+                                   args.swarm_events,
+                                   station[3],
+                                   station[4],
+                                   seed=args.seed + 2 + k)
+    return synthetic.inventory(stations), synthetic.picks(records)
+
+
+def run(module, picks, buffer_interval, memory=False):
+    app = module.PickListener(1, [ 'scdummyloc' ])
+    app.test = True
+    app.max_buffer_interval = buffer_interval
+    app.stage_report_interval = 0.
+    app.init()
+
+    if memory:
+        tracemalloc.start()
+
+    latencies = np.empty(len(picks))
+    buffer_len = 0
+    start = time.perf_counter()
+    for i, pick in enumerate(picks):
+        t = time.perf_counter()
+        app.handlePick(pick)
+        latencies[i] = time.perf_counter() - t
+        buffer_len = max(buffer_len, app.associator.buffer_len())
+    elapsed = time.perf_counter() - start
+
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    return { 'buffer_interval': buffer_interval,
+             'picks': len(picks),
+             'seconds': elapsed,
+             'picks_per_s': len(picks) / elapsed,
+             'p50_ms': float(np.percentile(latencies, 50)) * 1e3,
+             'p99_ms': float(np.percentile(latencies, 99)) * 1e3,
+             'max_buffer_len': buffer_len,
+             'clusters': len(app.associator.clusters),
+             'stages_ms': dict([ (name, stage[1] / stage[0] * 1e3)
+                                 for name, stage in app.stage_times.stages.items() ]) }
+
+
+def revision():
+    try:
+        return subprocess.check_output([ 'git', 'rev-parse', '--short', 'HEAD' ],
+                                       cwd=HERE, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(results, path, tolerance):
+    # regressions of picks/s and p99 latency beyond tolerance
+    previous = dict([ (r['buffer_interval'], r) for r in json.load(open(path))['runs'] ])
+    regressions = 0
+    print('\nCompared to %s:' % path)
+    for r in results['runs']:
+        p = previous.get(r['buffer_interval'])
+        if p is None:
+            continue
+        speed = r['picks_per_s'] / p['picks_per_s'] - 1
+        p99 = r['p99_ms'] / p['p99_ms'] - 1
+        flag = ''
+        if speed < -tolerance or p99 > tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('  buffer %8.0f s: picks/s %+6.1f %%, p99 %+6.1f %%%s' % ( r['buffer_interval'],
+                                                                      speed * 100,
+                                                                      p99 * 100,
+                                                                      flag ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stations', type=int, default=200)
+    parser.add_argument('--extent', type=float, default=2.0, help='network extent in degrees')
+    parser.add_argument('--duration', type=float, default=3600., help='seconds of picks')
+    parser.add_argument('--noise-rate', type=float, default=1.0, help='noise picks per second')
+    parser.add_argument('--swarms', type=int, default=1)
+    parser.add_argument('--swarm-events', type=int, default=100, help='events per swarm')
+    parser.add_argument('--buffer-intervals', default='300,900,3600,10800',
+                        help='comma separated max_buffer_interval values in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per buffer size, the fastest is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--save', action='store_true', help='store the results in %s' % RESULTS)
+    parser.add_argument('--compare', help='results file of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative change reported as regression by --compare')
+    args = parser.parse_args()
+
+    module = load_app()
+    inventory, picks = scenario(args)
+    client.Inventory.Instance().setInventory(inventory)
+    print('%d stations, %d picks over %.0f s' % ( args.stations, len(picks), args.duration ))
+
+    results = { 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'revision': revision(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'scenario': vars(args),
+                'runs': [] }
+
+    print('%10s %8s %10s %9s %9s %10s %10s' % ( 'buffer s', 'picks', 'picks/s', 'p50 ms', 'p99 ms',
+                                                 'buffered', 'peak MB' ))
+    intervals = [ float(i) for i in args.buffer_intervals.split(',') ]
+    # warm-up of imports and caches
+    run(module, picks[:200], intervals[0])
+    for interval in intervals:
+        r = min([ run(module, picks, interval) for i in range(max(1, args.repeat)) ],
+                key=lambda r: r['seconds'])
+        if not args.no_memory:
+            r['peak_memory_mb'] = run(module, picks, interval, memory=True) / 2**20
+        results['runs'] += [ r ]
+        print('%10.0f %8d %10.1f %9.3f %9.3f %10d %10s' % ( interval,
+                                                           r['picks'],
+                                                           r['picks_per_s'],
+                                                           r['p50_ms'],
+                                                           r['p99_ms'],
+                                                           r['max_buffer_len'],
+                                                           '%.1f' % r['peak_memory_mb'] if 'peak_memory_mb' in r else '-' ))
+
+    if args.save:
+        os.makedirs(RESULTS, exist_ok=True)
+        path = os.path.join(RESULTS, '%s-%s.json' % ( time.strftime('%Y%m%d-%H%M%S'), results['revision'] ))
+        json.dump(results, open(path, 'w'), indent=1, sort_keys=True)
+        print('\nSaved %s' % path)
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env seiscomp-python
+"""
+Synthetic pick streams as EventParameters archives for scdummyloc --ep.
+
+Picks of the events of a hypocentre list, of their aftershocks and of
+background noise are generated on the stations of an inventory XML file
+or of a synthetic network, at the P travel times of a layered velocity
+model, and written in time order:
+
+    generate.py --inventory inventory.xml --hypocentres events.txt \\
+                --noise-rate 50 --aftershocks 500 -o picks.xml
+    scdummyloc --ep picks.xml --playback
+
+Needs SeisComP for reading the inventory and writing the archive.
+"""
+
+import os
+import sys
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from seiscomp import core, datamodel, io
+import synthetic
+
+
+def read_stations(path):
+    """
+    (network, station, location, lat, lon, elevation) of the sensor
+    locations with coordinates, open or closed, of an inventory XML file.
+    """
+    ar = io.XMLArchive()
+    if not ar.open(path):
+        raise IOError('unable to open %s' % path)
+    inventory = datamodel.Inventory.Cast(ar.readObject())
+    ar.close()
+    if inventory is None:
+        raise ValueError('no inventory found in %s' % path)
+
+    stations = []
+    for inet in range(inventory.networkCount()):
+        net = inventory.network(inet)
+        for ista in range(net.stationCount()):
+            sta = net.station(ista)
+            for iloc in range(sta.sensorLocationCount()):
+                loc = sta.sensorLocation(iloc)
+                try:
+                    coordinates = ( loc.latitude(), loc.longitude(), loc.elevation() )
+                except Exception:
+                    continue
+                stations += [ ( net.code(), sta.code(), loc.code() ) + coordinates ]
+    return stations
+
+
+def write(obj, path):
+    ar = io.XMLArchive()
+    if not ar.create(path):
+        raise IOError('unable to create %s' % path)
+    ar.setFormattedOutput(True)
+    ar.writeObject(obj)
+    ar.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--inventory', help='inventory XML file, else a synthetic network')
+    parser.add_argument('--stations', type=int, default=5000, help='stations of the synthetic network')
+    parser.add_argument('--extent', type=float, default=6.0, help='synthetic network extent in degrees')
+    parser.add_argument('--write-inventory', help='write the synthetic network to this inventory XML file')
+    parser.add_argument('--hypocentres',
+                        help='text file of time, lat, lon, depth km, magnitude per line, '
+                             'time in epoch seconds or ISO 8601 UTC')
+    parser.add_argument('--velocity-model', default='0:5.5,10:6.2,30:8.0',
+                        help='P velocity layers as top depth km:vp km/s, comma separated')
+    parser.add_argument('--aftershocks', type=int, default=0, help='aftershocks per hypocentre')
+    parser.add_argument('--aftershock-duration', type=float, default=86400.,
+                        help='seconds after each hypocentre with aftershocks')
+    parser.add_argument('--start', help='noise start, epoch seconds or ISO 8601, '
+                                        'default the first hypocentre')
+    parser.add_argument('--duration', type=float, default=3600., help='noise duration in seconds')
+    parser.add_argument('--noise-rate', type=float, default=50., help='noise picks per second')
+    parser.add_argument('--jitter', type=float, default=0.1, help='pick time error in seconds')
+    parser.add_argument('--detection', type=float, default=0.9,
+                        help='probability of a pick within the detection radius')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefix',
+                        help='pick publicID prefix, default Pick/synthetic/<seed>/<start>')
+    parser.add_argument('-o', '--output', default='picks.xml')
+    args = parser.parse_args()
+
+    if args.inventory:
+        stations = read_stations(args.inventory)
+    else:
+        stations = synthetic.network(args.stations, extent=args.extent, seed=args.seed)
+    if not stations:
+        sys.stderr.write('no station with coordinates\n')
+        return 1
+
+    events = []
+    if args.hypocentres:
+        events = synthetic.read_hypocentres(args.hypocentres)
+    for k, event in enumerate(list(events)):
+        events += synthetic.aftershocks(event, args.aftershocks, args.aftershock_duration,
+                                        seed=args.seed + 3 + k)
+
+    if args.start is not None:
+        start = synthetic.read_time(args.start)
+    elif events:
+        start = min([ e[0] for e in events ])
+    else:
+        start = core.Time.GMT().seconds() - args.duration
+
+    model = synthetic.velocity_model(args.velocity_model)
+    records = synthetic.noise(stations, start, args.duration, args.noise_rate, seed=args.seed + 1)
+    records += synthetic.event_picks(stations, events, model, args.jitter, args.detection, seed=args.seed + 4)
+    prefix = args.prefix
+    if prefix is None:
+        prefix = 'Pick/synthetic/%d/%d' % ( args.seed, int(start) )
+    picks = synthetic.picks(records, prefix=prefix)
+
+    if not args.inventory and args.write_inventory:
+        write(synthetic.inventory(stations, start=int(start) - 86400), args.write_inventory)
+
+    ep = datamodel.EventParameters()
+    for pick in picks:
+        ep.add(pick)
+    write(ep, args.output)
+    sys.stderr.write('%d picks of %d events and %.0f s of noise on %d stations written to %s\n' % (
+        len(picks), len(events), args.duration, len(stations), args.output ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
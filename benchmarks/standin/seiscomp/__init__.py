@@ -0,0 +1,7 @@
+"""
+Stand-in for the parts of the SeisComP Python API scdummyloc uses.
+
+Only meant for benchmarking without a SeisComP installation: objects keep
+their attributes in plain Python, messages are counted instead of sent and
+nothing is read from or written to a database.
+"""
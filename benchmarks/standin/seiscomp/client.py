@@ -0,0 +1,140 @@
+from seiscomp import datamodel
+
+
+class Protocol(object):
+    LISTENER_GROUP = 'LISTENER_GROUP'
+
+
+class CommandLine(object):
+    """
+    No options are ever given, the benchmarks set attributes directly.
+    """
+
+    def addGroup(self, *args):
+        pass
+
+    def addOption(self, *args):
+        pass
+
+    def addStringOption(self, *args):
+        pass
+
+    def addIntOption(self, *args):
+        pass
+
+    def hasOption(self, name):
+        return False
+
+    def optionString(self, name):
+        raise RuntimeError('option %s not set' % name)
+
+    def optionInt(self, name):
+        raise RuntimeError('option %s not set' % name)
+
+
+class Connection(object):
+    """
+    Counts the messages and notifiers instead of sending them.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.objects = 0
+
+    def send(self, msg, *args):
+        self.messages += 1
+        self.objects += msg.size()
+        return True
+
+
+class Inventory(object):
+
+    _instance = None
+
+    def __init__(self):
+        self._inventory = datamodel.Inventory()
+
+    @staticmethod
+    def Instance():
+        if Inventory._instance is None:
+            Inventory._instance = Inventory()
+        return Inventory._instance
+
+    def inventory(self):
+        return self._inventory
+
+    def setInventory(self, inventory):
+        self._inventory = inventory
+
+
+class Application(object):
+
+    def __init__(self, argc, argv):
+        self._commandline = CommandLine()
+        self._connection = Connection()
+        self.createCommandLineDescription()
+
+    def __call__(self):
+        if not self.validateParameters():
+            return 1
+        if not self.initConfiguration() or not self.init():
+            return 1
+        ok = self.run()
+        self.done()
+        return 0 if ok else 1
+
+    def createCommandLineDescription(self):
+        return True
+
+    def setMessagingEnabled(self, enabled):
+        pass
+
+    def setDatabaseEnabled(self, enabled, fetch):
+        pass
+
+    def setPrimaryMessagingGroup(self, group):
+        pass
+
+    def addMessagingSubscription(self, group):
+        pass
+
+    def setLoadStationsEnabled(self, enabled):
+        pass
+
+    def setLoggingToStdErr(self, enabled):
+        pass
+
+    def enableTimer(self, seconds):
+        pass
+
+    def commandline(self):
+        return self._commandline
+
+    def connection(self):
+        return self._connection
+
+    def agencyID(self):
+        return 'BENCH'
+
+    def author(self):
+        return 'scdummyloc@bench'
+
+    def configGetDouble(self, name):
+        raise KeyError(name)
+
+    configGetInt = configGetString = configGetBool = configGetDouble
+
+    def validateParameters(self):
+        return True
+
+    def initConfiguration(self):
+        return True
+
+    def init(self):
+        return True
+
+    def run(self):
+        return True
+
+    def done(self):
+        pass
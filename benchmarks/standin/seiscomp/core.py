@@ -0,0 +1,65 @@
+import time as _time
+import datetime
+
+
+class Time(object):
+    """
+    Epoch time in seconds and microseconds.
+    """
+
+    __slots__ = ( '_seconds', '_microseconds' )
+
+    def __init__(self, seconds=0, microseconds=0):
+        seconds, microseconds = int(seconds), int(microseconds)
+        self._seconds = seconds + microseconds // 1000000
+        self._microseconds = microseconds % 1000000
+
+    @staticmethod
+    def GMT():
+        t = _time.time()
+        return Time(int(t), int(round((t % 1) * 1e6)))
+
+    @staticmethod
+    def FromFloat(t):
+        seconds = int(t // 1)
+        return Time(seconds, int(round((t - seconds) * 1e6)))
+
+    def seconds(self):
+        return self._seconds
+
+    def microseconds(self):
+        return self._microseconds
+
+    def length(self):
+        return self._seconds + self._microseconds * 1e-6
+
+    def _key(self):
+        return ( self._seconds, self._microseconds )
+
+    def __eq__(self, other):
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        return self._key() != other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __le__(self, other):
+        return self._key() <= other._key()
+
+    def __gt__(self, other):
+        return self._key() > other._key()
+
+    def __ge__(self, other):
+        return self._key() >= other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def iso(self):
+        t = datetime.datetime.fromtimestamp(self._seconds, datetime.timezone.utc)
+        return t.strftime('%Y-%m-%dT%H:%M:%S') + '.%06dZ' % self._microseconds
+
+    def __str__(self):
+        return self.iso()
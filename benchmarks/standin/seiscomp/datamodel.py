@@ -0,0 +1,342 @@
+import copy
+import itertools
+
+OP_ADD = 'add'
+OP_UPDATE = 'update'
+OP_REMOVE = 'remove'
+
+AUTOMATIC = 'automatic'
+MANUAL = 'manual'
+PRELIMINARY = 'preliminary'
+CENTROID = 'centroid'
+
+
+def _attributes(cls, *names):
+    # name() getters raising like unset optional attributes and setName() setters
+    def accessors(name):
+        member = '_' + name
+
+        def get(self):
+            try:
+                return getattr(self, member)
+            except AttributeError:
+                raise ValueError('%s.%s is not set' % ( cls.__name__, name ))
+
+        def set(self, value):
+            setattr(self, member, value)
+
+        return get, set
+
+    for name in names:
+        get, set = accessors(name)
+        setattr(cls, name, get)
+        setattr(cls, 'set' + name[0].upper() + name[1:], set)
+    return cls
+
+
+class Object(object):
+
+    @classmethod
+    def Cast(cls, obj):
+        return obj if isinstance(obj, cls) else None
+
+    _children = ()
+
+    def clone(self):
+        # attributes only, children are not cloned
+        obj = copy.copy(self)
+        for name, value in vars(self).items():
+            setattr(obj, name, [] if name in self._children else copy.deepcopy(value))
+        return obj
+
+
+class PublicObject(Object):
+
+    _ids = itertools.count()
+
+    def __init__(self, publicID=None):
+        if publicID is None:
+            publicID = '%s/%d' % ( type(self).__name__, next(PublicObject._ids) )
+        self._publicID = publicID
+
+    @classmethod
+    def Create(cls, publicID=None):
+        return cls(publicID)
+
+    def publicID(self):
+        return self._publicID
+
+
+class WaveformStreamID(Object):
+
+    def __init__(self, networkCode='', stationCode='', locationCode='', channelCode='', resourceURI=''):
+        self._networkCode = networkCode
+        self._stationCode = stationCode
+        self._locationCode = locationCode
+        self._channelCode = channelCode
+        self._resourceURI = resourceURI
+
+_attributes(WaveformStreamID, 'networkCode', 'stationCode', 'locationCode', 'channelCode', 'resourceURI')
+
+
+class TimeQuantity(Object):
+
+    def __init__(self, value=None):
+        self._value = value
+
+_attributes(TimeQuantity, 'value', 'uncertainty')
+
+
+class RealQuantity(TimeQuantity):
+    pass
+
+
+class Phase(Object):
+
+    def __init__(self, code=''):
+        self._code = code
+
+_attributes(Phase, 'code')
+
+
+class CreationInfo(Object):
+    pass
+
+_attributes(CreationInfo, 'agencyID', 'author', 'creationTime', 'modificationTime')
+
+
+class Pick(PublicObject):
+    pass
+
+_attributes(Pick, 'time', 'waveformID', 'phaseHint', 'evaluationMode', 'creationInfo', 'methodID')
+
+
+class Arrival(Object):
+    pass
+
+_attributes(Arrival, 'pickID', 'phase', 'weight', 'timeUsed')
+
+
+class OriginQuality(Object):
+    pass
+
+_attributes(OriginQuality, 'associatedPhaseCount', 'usedPhaseCount',
+            'associatedStationCount', 'usedStationCount')
+
+
+class Origin(PublicObject):
+
+    _children = ( '_arrivals', )
+
+    def __init__(self, publicID=None):
+        PublicObject.__init__(self, publicID)
+        self._arrivals = []
+
+    def add(self, arrival):
+        self._arrivals.append(arrival)
+        return True
+
+    def remove(self, arrival):
+        if arrival in self._arrivals:
+            self._arrivals.remove(arrival)
+            return True
+        return False
+
+    def arrivalCount(self):
+        return len(self._arrivals)
+
+    def arrival(self, i):
+        return self._arrivals[i]
+
+_attributes(Origin, 'latitude', 'longitude', 'depth', 'time', 'methodID', 'type',
+            'evaluationMode', 'evaluationStatus', 'creationInfo', 'quality')
+
+
+class EventParameters(PublicObject):
+
+    def __init__(self, publicID=None):
+        PublicObject.__init__(self, publicID)
+        self._picks = []
+        self._origins = []
+
+    def add(self, obj):
+        children = self._picks if isinstance(obj, Pick) else self._origins
+        children.append(obj)
+        if Notifier.IsEnabled():
+            Notifier.Create('EventParameters', OP_ADD, obj)
+            for i in range(obj.arrivalCount() if isinstance(obj, Origin) else 0):
+                Notifier.Create(obj.publicID(), OP_ADD, obj.arrival(i))
+        return True
+
+    def remove(self, obj):
+        for children in ( self._picks, self._origins ):
+            if obj in children:
+                children.remove(obj)
+                return True
+        return False
+
+    def pickCount(self):
+        return len(self._picks)
+
+    def pick(self, i):
+        return self._picks[i]
+
+    def originCount(self):
+        return len(self._origins)
+
+    def origin(self, i):
+        return self._origins[i]
+
+
+class Stream(PublicObject):
+    pass
+
+_attributes(Stream, 'code', 'start', 'end')
+
+
+class SensorLocation(PublicObject):
+
+    def __init__(self, publicID=None):
+        PublicObject.__init__(self, publicID)
+        self._streams = []
+
+    def add(self, stream):
+        self._streams.append(stream)
+        return True
+
+    def streamCount(self):
+        return len(self._streams)
+
+    def stream(self, i):
+        return self._streams[i]
+
+_attributes(SensorLocation, 'code', 'start', 'end', 'latitude', 'longitude', 'elevation')
+
+
+class Station(PublicObject):
+
+    def __init__(self, publicID=None):
+        PublicObject.__init__(self, publicID)
+        self._locations = []
+
+    def add(self, location):
+        self._locations.append(location)
+        return True
+
+    def sensorLocationCount(self):
+        return len(self._locations)
+
+    def sensorLocation(self, i):
+        return self._locations[i]
+
+_attributes(Station, 'code', 'start', 'end', 'latitude', 'longitude', 'elevation')
+
+
+class Network(PublicObject):
+
+    def __init__(self, publicID=None):
+        PublicObject.__init__(self, publicID)
+        self._stations = []
+
+    def add(self, station):
+        self._stations.append(station)
+        return True
+
+    def stationCount(self):
+        return len(self._stations)
+
+    def station(self, i):
+        return self._stations[i]
+
+_attributes(Network, 'code', 'start', 'end')
+
+
+class Inventory(PublicObject):
+
+    def __init__(self, publicID=None):
+        PublicObject.__init__(self, publicID)
+        self._networks = []
+
+    def add(self, network):
+        self._networks.append(network)
+        return True
+
+    def networkCount(self):
+        return len(self._networks)
+
+    def network(self, i):
+        return self._networks[i]
+
+
+class Notifier(Object):
+
+    _enabled = False
+    _pending = []
+
+    def __init__(self, parentID, operation, obj):
+        self._parentID = parentID
+        self._operation = operation
+        self._object = obj
+
+    def parentID(self):
+        return self._parentID
+
+    def operation(self):
+        return self._operation
+
+    def object(self):
+        return self._object
+
+    @staticmethod
+    def Enable():
+        Notifier._enabled = True
+
+    @staticmethod
+    def Disable():
+        Notifier._enabled = False
+
+    @staticmethod
+    def IsEnabled():
+        return Notifier._enabled
+
+    @staticmethod
+    def Create(parentID, operation, obj):
+        notifier = Notifier(parentID, operation, obj)
+        if Notifier._enabled:
+            Notifier._pending.append(notifier)
+        return notifier
+
+    @staticmethod
+    def GetMessage(allNotifier=True):
+        if not Notifier._pending:
+            return None
+        msg = NotifierMessage()
+        for notifier in Notifier._pending:
+            msg.attach(notifier)
+        del Notifier._pending[:]
+        return msg
+
+
+class NotifierMessage(Object):
+
+    def __init__(self):
+        self._notifiers = []
+
+    def attach(self, notifier):
+        self._notifiers.append(notifier)
+        return True
+
+    def size(self):
+        return len(self._notifiers)
+
+
+class ArtificialOriginMessage(Object):
+
+    def __init__(self, origin):
+        self._origin = origin
+
+    def origin(self):
+        return self._origin
+
+    def size(self):
+        return 1
@@ -0,0 +1,177 @@
+import datetime
+import xml.etree.ElementTree as ET
+
+from seiscomp import core, datamodel
+
+NAMESPACE = 'http://geofon.gfz-potsdam.de/ns/seiscomp3-schema/0.12'
+
+
+def _time(text):
+    # epoch Time of an ISO 8601 UTC text as written by Time.iso()
+    date, _, fraction = text.rstrip('Z').partition('.')
+    t = datetime.datetime.strptime(date, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+    return core.Time(int(t.timestamp()), int((fraction + '000000')[:6]))
+
+
+def _get(obj, name):
+    # value of an optional attribute, None if unset
+    try:
+        return getattr(obj, name)()
+    except ValueError:
+        return None
+
+
+def _child(parent, tag, text=None):
+    element = ET.SubElement(parent, tag)
+    if text is not None:
+        element.text = str(text)
+    return element
+
+
+def _quantity(parent, tag, quantity):
+    if quantity is not None:
+        value = quantity.value()
+        _child(_child(parent, tag), 'value', value.iso() if isinstance(value, core.Time) else repr(float(value)))
+
+
+class XMLArchive(object):
+    """
+    Writes EventParameters with their picks and origins in the layout of
+    SeisComP XML and reads their picks back, enough for --ep replays and
+    their output on the stand-in. Inventories and compressed archives need
+    SeisComP.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.mode = None
+        self.formatted = False
+        self.objects = []
+
+    def setCompression(self, enabled):
+        if enabled:
+            raise NotImplementedError('compressed XML archives need SeisComP')
+
+    def setFormattedOutput(self, enabled):
+        self.formatted = enabled
+
+    def open(self, path):
+        try:
+            root = ET.parse(path).getroot()
+        except (IOError, ET.ParseError):
+            return False
+        self.path, self.mode = path, 'r'
+        self.objects = [ self.read_ep(e) for e in root if e.tag.split('}')[-1] == 'EventParameters' ]
+        return True
+
+    def create(self, path):
+        try:
+            open(path, 'w').close()
+        except IOError:
+            return False
+        self.path, self.mode = path, 'w'
+        self.objects = []
+        return True
+
+    def readObject(self):
+        return self.objects.pop(0) if self.objects else None
+
+    def writeObject(self, obj):
+        if not isinstance(obj, datamodel.EventParameters):
+            raise NotImplementedError('only EventParameters are archived by the stand-in')
+        self.objects.append(obj)
+
+    def close(self):
+        if self.mode == 'w':
+            root = ET.Element('seiscomp', { 'xmlns': NAMESPACE, 'version': '0.12' })
+            for ep in self.objects:
+                self.write_ep(root, ep)
+            if self.formatted:
+                ET.indent(root, space='  ')
+            with open(self.path, 'w') as f:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                f.write(ET.tostring(root, encoding='unicode'))
+                f.write('\n')
+        self.mode = None
+        self.objects = []
+
+    def write_ep(self, root, ep):
+        element = _child(root, 'EventParameters')
+        element.set('publicID', ep.publicID())
+        for i in range(ep.pickCount()):
+            pick = ep.pick(i)
+            e = _child(element, 'pick')
+            e.set('publicID', pick.publicID())
+            _quantity(e, 'time', _get(pick, 'time'))
+            wfid = _get(pick, 'waveformID')
+            if wfid is not None:
+                w = _child(e, 'waveformID')
+                for name in ( 'networkCode', 'stationCode', 'locationCode', 'channelCode' ):
+                    w.set(name, getattr(wfid, name)())
+            phase = _get(pick, 'phaseHint')
+            if phase is not None:
+                _child(e, 'phaseHint', phase.code())
+            if _get(pick, 'evaluationMode') is not None:
+                _child(e, 'evaluationMode', pick.evaluationMode())
+
+        for i in range(ep.originCount()):
+            origin = ep.origin(i)
+            e = _child(element, 'origin')
+            e.set('publicID', origin.publicID())
+            for name in ( 'time', 'latitude', 'longitude', 'depth' ):
+                _quantity(e, name, _get(origin, name))
+            for name in ( 'methodID', 'type', 'evaluationMode', 'evaluationStatus' ):
+                if _get(origin, name) is not None:
+                    _child(e, name, getattr(origin, name)())
+            quality = _get(origin, 'quality')
+            if quality is not None:
+                q = _child(e, 'quality')
+                for name in ( 'associatedPhaseCount', 'usedPhaseCount',
+                              'associatedStationCount', 'usedStationCount' ):
+                    if _get(quality, name) is not None:
+                        _child(q, name, getattr(quality, name)())
+            ci = _get(origin, 'creationInfo')
+            if ci is not None:
+                c = _child(e, 'creationInfo')
+                for name in ( 'agencyID', 'author', 'creationTime', 'modificationTime' ):
+                    value = _get(ci, name)
+                    if value is not None:
+                        _child(c, name, value.iso() if isinstance(value, core.Time) else value)
+            for k in range(origin.arrivalCount()):
+                arrival = origin.arrival(k)
+                a = _child(e, 'arrival')
+                _child(a, 'pickID', arrival.pickID())
+                _child(a, 'phase', arrival.phase().code())
+                _child(a, 'timeUsed', 'true' if arrival.timeUsed() else 'false')
+                _child(a, 'weight', repr(float(arrival.weight())))
+
+    def read_ep(self, element):
+        ep = datamodel.EventParameters(element.get('publicID'))
+        for e in element:
+            if e.tag.split('}')[-1] != 'pick':
+                continue
+            pick = datamodel.Pick.Create(e.get('publicID'))
+            for child in e:
+                tag = child.tag.split('}')[-1]
+                if tag == 'time':
+                    pick.setTime(datamodel.TimeQuantity(_time(child[0].text)))
+                elif tag == 'waveformID':
+                    pick.setWaveformID(datamodel.WaveformStreamID(*[ child.get(name, '') for name in (
+                        'networkCode', 'stationCode', 'locationCode', 'channelCode' ) ]))
+                elif tag == 'phaseHint':
+                    pick.setPhaseHint(datamodel.Phase(child.text))
+                elif tag == 'evaluationMode':
+                    pick.setEvaluationMode(child.text)
+            ep.add(pick)
+        return ep
+
+
+class VBinaryArchive(XMLArchive):
+    """
+    Not available in the stand-in.
+    """
+
+    def open(self, path):
+        raise NotImplementedError('binary archives need SeisComP')
+
+    create = open
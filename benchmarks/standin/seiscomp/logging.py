@@ -0,0 +1,27 @@
+import sys
+
+# messages up to this level are written to stderr, 0 silences all
+level = 1
+
+_levels = { 'error': 1, 'warning': 2, 'info': 3, 'debug': 4 }
+
+
+def _log(name, msg):
+    if _levels[name] <= level:
+        sys.stderr.write('[%s] %s\n' % ( name, msg ))
+
+
+def error(msg):
+    _log('error', msg)
+
+
+def warning(msg):
+    _log('warning', msg)
+
+
+def info(msg):
+    _log('info', msg)
+
+
+def debug(msg):
+    _log('debug', msg)
@@ -0,0 +1,19 @@
+import math
+
+
+def delazi_wgs84(lat1, lon1, lat2, lon2):
+    """
+    Distance in degrees, azimuth and back azimuth between two points on a
+    sphere, close enough to the WGS84 results for benchmarking.
+    """
+    la1, lo1, la2, lo2 = [ math.radians(a) for a in (lat1, lon1, lat2, lon2) ]
+    h = ( math.sin((la2 - la1) / 2)**2 +
+          math.cos(la1) * math.cos(la2) * math.sin((lo2 - lo1) / 2)**2 )
+    delta = math.degrees(2 * math.asin(math.sqrt(min(max(h, 0.), 1.))))
+
+    def azimuth(la1, lo1, la2, lo2):
+        y = math.sin(lo2 - lo1) * math.cos(la2)
+        x = math.cos(la1) * math.sin(la2) - math.sin(la1) * math.cos(la2) * math.cos(lo2 - lo1)
+        return math.degrees(math.atan2(y, x)) % 360.
+
+    return delta, azimuth(la1, lo1, la2, lo2), azimuth(la2, lo2, la1, lo1)
@@ -0,0 +1,237 @@
+"""
+Synthetic networks and pick streams for benchmarking scdummyloc.
+
+Works with the SeisComP stand-in of the benchmarks as well as with
+SeisComP itself. Stations are spread uniformly over a square area, noise
+picks arrive as a Poisson process on random stations and swarm events
+are picked on the stations around their epicentre, at the P travel time
+of a homogeneous half space. Events of a hypocentre list and their
+aftershocks are picked at the travel times of a layered velocity model.
+"""
+
+import math
+import random
+import datetime
+import numpy as np
+from seiscomp import core, datamodel
+
+KM_PER_DEGREE = 110.0
+
+
+def network(count, lat=46.8, lon=8.2, extent=2.0, code='XX', seed=0):
+    """
+    List of (network, station, location, lat, lon, elevation) of count
+    stations within extent degrees around lat, lon.
+    """
+    rng = random.Random(seed)
+    stations = []
+    for i in range(count):
+        stations += [ ( code,
+                        'S%04d' % i,
+                        '',
+                        lat + rng.uniform(-extent, extent) / 2,
+                        lon + rng.uniform(-extent, extent) / 2,
+                        rng.uniform(200., 2000.) ) ]
+    return stations
+
+
+def inventory(stations, channels=( 'HHZ', ), start=0):
+    """
+    Inventory with one sensor location and the given channels per station,
+    all open since start.
+    """
+    inv = datamodel.Inventory()
+    networks = {}
+    for net, sta, loc, lat, lon, el in stations:
+        if net not in networks:
+            networks[net] = datamodel.Network.Create()
+            networks[net].setCode(net)
+            networks[net].setStart(core.Time(start))
+            inv.add(networks[net])
+
+        station = datamodel.Station.Create()
+        location = datamodel.SensorLocation.Create()
+        for obj, code in ( (station, sta), (location, loc) ):
+            obj.setCode(code)
+            obj.setStart(core.Time(start))
+            obj.setLatitude(lat)
+            obj.setLongitude(lon)
+            obj.setElevation(el)
+        for cha in channels:
+            stream = datamodel.Stream.Create()
+            stream.setCode(cha)
+            stream.setStart(core.Time(start))
+            location.add(stream)
+        station.add(location)
+        networks[net].add(station)
+    return inv
+
+
+def distance(lat1, lon1, lat2, lon2):
+    # km on a sphere
+    la1, lo1, la2, lo2 = [ math.radians(a) for a in (lat1, lon1, lat2, lon2) ]
+    h = ( math.sin((la2 - la1) / 2)**2 +
+          math.cos(la1) * math.cos(la2) * math.sin((lo2 - lo1) / 2)**2 )
+    return math.degrees(2 * math.asin(math.sqrt(min(h, 1.)))) * KM_PER_DEGREE
+
+
+def noise(stations, start, duration, rate, seed=1):
+    """
+    (time, station) of picks at rate per second over the whole network.
+    """
+    rng = random.Random(seed)
+    records = []
+    t = start
+    while rate > 0.:
+        t += rng.expovariate(rate)
+        if t >= start + duration:
+            break
+        records += [ (t, rng.choice(stations)) ]
+    return records
+
+
+def swarm(stations, start, duration, events, lat, lon, spread=5., depth=5.,
+          vp=6.0, radius=30., jitter=0.1, detection=0.9, seed=2):
+    """
+    (time, station) of the picks of events uniformly distributed in time,
+    epicentres normally distributed with spread km around lat, lon.
+    Stations within radius km of the epicentre pick the P arrival with
+    probability detection, with normally distributed jitter in seconds.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(events):
+        t0 = start + rng.uniform(0., duration)
+        la = lat + rng.gauss(0., spread) / KM_PER_DEGREE
+        lo = lon + rng.gauss(0., spread) / KM_PER_DEGREE / max(math.cos(math.radians(la)), 0.01)
+        for station in stations:
+            delta = distance(la, lo, station[3], station[4])
+            if delta > radius or rng.random() > detection:
+                continue
+            hypocentral = math.hypot(delta, depth + station[5] / 1000.)
+            records += [ (t0 + hypocentral / vp + rng.gauss(0., jitter), station) ]
+    return records
+
+
+def velocity_model(spec):
+    """
+    Layers [(top depth km, vp km/s), ...] of 'depth:vp,depth:vp,...',
+    the first layer starts at the surface.
+    """
+    layers = sorted([ tuple([ float(v) for v in layer.split(':') ]) for layer in spec.split(',') ])
+    return [ (0., layers[0][1]) ] + layers[1:] if layers[0][0] > 0. else layers
+
+
+def travel_times(model, distances, depth):
+    """
+    P travel times in seconds along straight rays from a hypocentre at
+    depth km to stations at distances km, through the layers above it.
+    """
+    distances = np.asarray(distances, dtype=float)
+    hypocentral = np.hypot(distances, depth)
+    if depth <= 0.:
+        return hypocentral / model[0][1]
+
+    # share of the ray in each layer is the share of the depth range
+    slowness = 0.
+    for k, (top, vp) in enumerate(model):
+        bottom = model[k+1][0] if k + 1 < len(model) else float('inf')
+        thickness = max(0., min(bottom, depth) - top)
+        slowness += thickness / depth / vp
+    return hypocentral * slowness
+
+
+def detection_radius(magnitude):
+    # km within which an event of this magnitude is picked
+    return 10**(0.4 * magnitude + 0.9)
+
+
+def read_hypocentres(path):
+    """
+    (time, lat, lon, depth, magnitude) of the lines of a text file, comma
+    or blank separated, time in epoch seconds or ISO 8601 UTC. Empty lines
+    and lines starting with # are skipped.
+    """
+    events = []
+    for line in open(path):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.replace(',', ' ').split()
+        events += [ tuple([ read_time(fields[0]) ] + [ float(v) for v in fields[1:5] ]) ]
+    return events
+
+
+def read_time(text):
+    # epoch seconds of epoch seconds or ISO 8601 UTC
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text.rstrip('Z')).replace(
+            tzinfo=datetime.timezone.utc).timestamp()
+
+
+def aftershocks(event, count, duration, spread=5., seed=3):
+    """
+    count events after event within duration seconds, Omori decay in time
+    (p = 1), epicentres normally distributed with spread km, magnitudes
+    Gutenberg-Richter distributed (b = 1) below the mainshock.
+    """
+    rng = random.Random(seed)
+    t0, lat, lon, depth, magnitude = event
+    c = 60.
+    events = []
+    for i in range(count):
+        # inverse of the cumulative Omori rate
+        dt = c * ( (1 + duration / c)**rng.random() - 1 )
+        la = lat + rng.gauss(0., spread) / KM_PER_DEGREE
+        lo = lon + rng.gauss(0., spread) / KM_PER_DEGREE / max(math.cos(math.radians(la)), 0.01)
+        events += [ ( t0 + dt,
+                      la,
+                      lo,
+                      max(0., depth + rng.gauss(0., spread / 2)),
+                      max(0., magnitude - 1.2 - rng.expovariate(math.log(10))) ) ]
+    return events
+
+
+def event_picks(stations, events, model, jitter=0.1, detection=0.9, seed=4):
+    """
+    (time, station) of the P picks of (time, lat, lon, depth, magnitude)
+    events on the stations within their detection radius, picked with
+    probability detection and normally distributed jitter in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    lats = np.array([ s[3] for s in stations ])
+    lons = np.array([ s[4] for s in stations ])
+    elevations = np.array([ s[5] for s in stations ]) / 1000.
+    records = []
+    for t0, lat, lon, depth, magnitude in events:
+        la1, lo1, la2, lo2 = [ np.radians(a) for a in (lat, lon, lats, lons) ]
+        h = ( np.sin((la2 - la1) / 2)**2 +
+              np.cos(la1) * np.cos(la2) * np.sin((lo2 - lo1) / 2)**2 )
+        distances = np.degrees(2 * np.arcsin(np.sqrt(np.clip(h, 0., 1.)))) * KM_PER_DEGREE
+
+        picked = np.flatnonzero( (distances <= detection_radius(magnitude)) &
+                                 (rng.random(len(stations)) < detection) )
+        times = ( t0 +
+                  travel_times(model, distances[picked], depth) +
+                  elevations[picked] / model[0][1] +
+                  rng.normal(0., jitter, len(picked)) )
+        records += [ (float(t), stations[i]) for t, i in zip(times, picked.tolist()) ]
+    return records
+
+
+def picks(records, channel='HHZ', phase='P', prefix='Pick/synthetic'):
+    """
+    Picks of the (time, station) records in time order.
+    """
+    result = []
+    for i, (t, station) in enumerate(sorted(records, key=lambda r: r[0])):
+        microseconds = int(round(t * 1e6))
+        pick = datamodel.Pick.Create('%s/%d' % ( prefix, i ))
+        pick.setTime(datamodel.TimeQuantity(core.Time(microseconds // 1000000, microseconds % 1000000)))
+        pick.setWaveformID(datamodel.WaveformStreamID(station[0], station[1], station[2], channel, ''))
+        pick.setPhaseHint(datamodel.Phase(phase))
+        pick.setEvaluationMode(datamodel.AUTOMATIC)
+        result += [ pick ]
+    return result